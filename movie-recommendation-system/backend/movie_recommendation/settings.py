@@ -174,6 +174,56 @@ AUTH_USER_MODEL = 'users.CustomUser'
 TMDB_API_KEY = env('TMDB_API_KEY', default='your-tmdb-api-key-here')
 TMDB_BASE_URL = 'https://api.themoviedb.org/3'
 
+# 推荐引擎配置
+# 评分数量变化比例达到该值时重新训练共享模型
+RECOMMENDATION_RETRAIN_THRESHOLD = env.float('RECOMMENDATION_RETRAIN_THRESHOLD', default=0.05)
+# 共享模型检查评分数据变化的最小间隔（秒）
+RECOMMENDATION_REGISTRY_CHECK_INTERVAL = env.int('RECOMMENDATION_REGISTRY_CHECK_INTERVAL', default=60)
+# 共享模型最长使用时间（秒），超过后若数据有变化则完整重训（增量更新之外的一致性校准）
+RECOMMENDATION_MODEL_MAX_AGE = env.int('RECOMMENDATION_MODEL_MAX_AGE', default=6 * 3600)
+# 分块相似度计算的内存预算（MB）与线程数（默认为CPU核数，最多4个）
+RECOMMENDATION_SIMILARITY_MEMORY_MB = env.int('RECOMMENDATION_SIMILARITY_MEMORY_MB', default=256)
+RECOMMENDATION_SIMILARITY_WORKERS = env.int('RECOMMENDATION_SIMILARITY_WORKERS', default=0)
+# 电影内容特征缓存最长使用时间（秒），本进程内的电影变化会立即使缓存失效
+RECOMMENDATION_CONTENT_FEATURES_MAX_AGE = env.int('RECOMMENDATION_CONTENT_FEATURES_MAX_AGE', default=3600)
+# 模型文件目录，训练后导出，各工作进程以内存映射方式共享加载（为空时不导出）
+RECOMMENDATION_MODEL_DIR = env('RECOMMENDATION_MODEL_DIR', default=os.path.join(BASE_DIR, 'models'))
+# 每个模型保留的历史版本数量（用于回滚）
+RECOMMENDATION_MODEL_KEEP_VERSIONS = env.int('RECOMMENDATION_MODEL_KEEP_VERSIONS', default=5)
+# 同一模型同时只训练一次：没有旧模型时等待其他训练的最长时间、训练锁文件的过期时间（秒）
+RECOMMENDATION_FIT_WAIT_TIMEOUT = env.int('RECOMMENDATION_FIT_WAIT_TIMEOUT', default=300)
+RECOMMENDATION_FIT_LOCK_TIMEOUT = env.int('RECOMMENDATION_FIT_LOCK_TIMEOUT', default=3600)
+# 训练任务心跳超时（秒），超时未更新的running任务在工作进程领取任务时回收；
+# 执行次数未达到上限的任务重新排队，否则标记为失败
+RECOMMENDATION_TRAINING_HEARTBEAT_TIMEOUT = env.int('RECOMMENDATION_TRAINING_HEARTBEAT_TIMEOUT', default=300)
+RECOMMENDATION_TRAINING_MAX_ATTEMPTS = env.int('RECOMMENDATION_TRAINING_MAX_ATTEMPTS', default=2)
+# ALS矩阵分解：隐因子维数、正则化系数、迭代轮数，隐式模式把评分视为偏好强度（置信度 1 + alpha × 评分）
+RECOMMENDATION_ALS_FACTORS = env.int('RECOMMENDATION_ALS_FACTORS', default=64)
+RECOMMENDATION_ALS_REGULARIZATION = env.float('RECOMMENDATION_ALS_REGULARIZATION', default=0.1)
+RECOMMENDATION_ALS_ITERATIONS = env.int('RECOMMENDATION_ALS_ITERATIONS', default=15)
+RECOMMENDATION_ALS_ALPHA = env.float('RECOMMENDATION_ALS_ALPHA', default=40.0)
+RECOMMENDATION_ALS_IMPLICIT = env.bool('RECOMMENDATION_ALS_IMPLICIT', default=False)
+# ALS逐行求解的线程数，大于1时在线程池中并行（BLAS运算释放GIL，建议只在训练工作进程中开启）
+RECOMMENDATION_ALS_WORKERS = env.int('RECOMMENDATION_ALS_WORKERS', default=1)
+# 实时邻居查询的近似最近邻索引（ivf/lsh，为空时精确扫描所有用户）及其截断SVD嵌入维数
+RECOMMENDATION_ANN_INDEX = env('RECOMMENDATION_ANN_INDEX', default='')
+RECOMMENDATION_ANN_RANK = env.int('RECOMMENDATION_ANN_RANK', default=64)
+# 评分有变化的用户在近似最近邻索引中的嵌入已过期，写回索引前查询时始终作为候选；累计超过该数量时批量写回
+RECOMMENDATION_ANN_REFRESH_ROWS = env.int('RECOMMENDATION_ANN_REFRESH_ROWS', default=256)
+# 训练时的降维维数（随机化截断SVD），大于0时邻居搜索与电影相似度在低维嵌入上计算
+RECOMMENDATION_REDUCTION_RANK = env.int('RECOMMENDATION_REDUCTION_RANK', default=0)
+# 混合推荐的整体延迟预算（秒，可被配置参数timeout覆盖）与候选来源线程池大小
+RECOMMENDATION_HYBRID_TIMEOUT = env.float('RECOMMENDATION_HYBRID_TIMEOUT', default=2.0)
+RECOMMENDATION_HYBRID_WORKERS = env.int('RECOMMENDATION_HYBRID_WORKERS', default=8)
+# 混合推荐每个候选来源同时排队或运行的任务数上限，达到上限时跳过该来源，避免持续超时的来源占满线程池
+RECOMMENDATION_HYBRID_SOURCE_LIMIT = env.int('RECOMMENDATION_HYBRID_SOURCE_LIMIT', default=2)
+# 热门电影榜单最长使用时间（秒），过期后在后台重建；贝叶斯加权的先验评分人数（为0时取评分人数的80%分位数）
+RECOMMENDATION_POPULARITY_MAX_AGE = env.int('RECOMMENDATION_POPULARITY_MAX_AGE', default=600)
+RECOMMENDATION_POPULARITY_MIN_VOTES = env.float('RECOMMENDATION_POPULARITY_MIN_VOTES', default=0)
+# 评分数量少于该值的用户走冷启动路径（不获取或训练模型），从偏好类型的预计算榜单中推荐；每个类型预计算的电影数量
+RECOMMENDATION_COLD_START_MIN_RATINGS = env.int('RECOMMENDATION_COLD_START_MIN_RATINGS', default=1)
+RECOMMENDATION_COLD_START_GENRE_TOP_N = env.int('RECOMMENDATION_COLD_START_GENRE_TOP_N', default=100)
+
 # 日志配置
 LOGGING = {
     'version': 1,
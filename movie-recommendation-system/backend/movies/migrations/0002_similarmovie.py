@@ -0,0 +1,58 @@
+# Generated by Django 4.2 on 2026-10-18 04:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarMovie",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField(verbose_name="相似度")),
+                ("rank", models.PositiveSmallIntegerField(verbose_name="排名")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "movie",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_entries",
+                        to="movies.movie",
+                        verbose_name="电影",
+                    ),
+                ),
+                (
+                    "similar_movie",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="movies.movie",
+                        verbose_name="相似电影",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "相似电影",
+                "verbose_name_plural": "相似电影",
+                "ordering": ["movie", "rank"],
+                "unique_together": {("movie", "rank")},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2 on 2026-10-18 05:47
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_computed_movies(apps, schema_editor):
+    """已有相似电影记录的电影视为已计算"""
+    Movie = apps.get_model("movies", "Movie")
+    SimilarMovie = apps.get_model("movies", "SimilarMovie")
+    Movie.objects.filter(id__in=SimilarMovie.objects.values("movie_id")).update(
+        similar_computed_at=timezone.now()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0002_similarmovie"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movie",
+            name="similar_computed_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="build_similar_movies最近一次计算该电影相似电影的时间，未计算过时为空",
+                null=True,
+                verbose_name="相似电影计算时间",
+            ),
+        ),
+        migrations.RunPython(mark_computed_movies, migrations.RunPython.noop),
+    ]
@@ -39,6 +39,10 @@ class Movie(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    similar_computed_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='相似电影计算时间',
+        help_text='build_similar_movies最近一次计算该电影相似电影的时间，未计算过时为空'
+    )
     
     class Meta:
         verbose_name = '电影'
@@ -98,4 +102,22 @@ class MovieCredit(models.Model):
         """获取头像完整URL"""
         if self.profile_path:
             return f'https://image.tmdb.org/t/p/w185{self.profile_path}'
-        return None
\ No newline at end of file
+        return None
+
+
+class SimilarMovie(models.Model):
+    """预计算的相似电影（每部电影保留前K个，由build_similar_movies命令生成）"""
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, verbose_name='电影', related_name='similar_entries')
+    similar_movie = models.ForeignKey(Movie, on_delete=models.CASCADE, verbose_name='相似电影', related_name='+')
+    score = models.FloatField(verbose_name='相似度')
+    rank = models.PositiveSmallIntegerField(verbose_name='排名')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    
+    class Meta:
+        verbose_name = '相似电影'
+        verbose_name_plural = '相似电影'
+        ordering = ['movie', 'rank']
+        unique_together = ['movie', 'rank']
+    
+    def __str__(self):
+        return f'{self.movie_id} -> {self.similar_movie_id}: {self.score:.3f}'
@@ -6,7 +6,7 @@ from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from django_filters.rest_framework import DjangoFilterBackend
 from django.db.models import Q
 
-from .models import Movie, Genre
+from .models import Movie, Genre, SimilarMovie
 from .serializers import MovieSerializer, MovieListSerializer, GenreSerializer, MovieSearchSerializer
 from .filters import MovieFilter
 from .services.tmdb_service import TMDBService
@@ -88,13 +88,22 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
         """获取相似电影"""
         movie = self.get_object()
 
-        # 基于类型和评分获取相似电影
-        similar_movies = Movie.objects.filter(
-            genres__in=movie.genres.all()
-        ).exclude(id=movie.id).distinct()
-
-        # 按评分和流行度排序
-        similar_movies = similar_movies.order_by('-vote_average', '-popularity')[:20]
+        # 优先读取预计算的相似电影表（按排名顺序）
+        similar_movies = [
+            entry.similar_movie
+            for entry in SimilarMovie.objects.filter(movie=movie)
+            .select_related('similar_movie')
+            .prefetch_related('similar_movie__genres')[:20]
+        ]
+
+        if not similar_movies:
+            # 尚未预计算时，基于类型和评分获取相似电影
+            similar_movies = Movie.objects.filter(
+                genres__in=movie.genres.all()
+            ).exclude(id=movie.id).distinct()
+
+            # 按评分和流行度排序
+            similar_movies = similar_movies.order_by('-vote_average', '-popularity')[:20]
 
         serializer = MovieListSerializer(similar_movies, many=True)
         return Response(serializer.data)
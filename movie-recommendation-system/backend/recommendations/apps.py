@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class RecommendationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recommendations'
-    verbose_name = '推荐系统'
\ No newline at end of file
+    verbose_name = '推荐系统'
+
+    def ready(self):
+        # 注册评分变化信号，增量更新共享模型
+        from . import signals  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,77 @@
+import time
+import numpy as np
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendations.services.ann_index import INDEX_CLASSES, create_index
+from recommendations.services.knn_recommender import KNNRecommender
+
+
+class Command(BaseCommand):
+    help = '对比近似最近邻索引与精确扫描的用户邻居查询：召回率@K、候选数量与查询耗时'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind', choices=list(INDEX_CLASSES), action='append',
+            help='索引类型，可重复指定，默认全部'
+        )
+        parser.add_argument('--k', type=int, default=20, help='每个用户查询的邻居数量')
+        parser.add_argument('--min-similarity', type=float, default=0.0, help='最小相似度阈值')
+        parser.add_argument('--rank', type=int, default=None, help='截断SVD嵌入维数，默认取配置')
+        parser.add_argument('--queries', type=int, default=200, help='随机抽取的查询用户数')
+        parser.add_argument('--n-probe', type=int, default=8, help='IVF查询扫描的聚类数量')
+        parser.add_argument('--n-lists', type=int, default=0, help='IVF聚类数量，默认为用户数的平方根')
+        parser.add_argument('--n-bits', type=int, default=0, help='LSH每张表的哈希位数，为0时按向量数量选取')
+        parser.add_argument('--n-tables', type=int, default=16, help='LSH哈希表数量')
+        parser.add_argument('--seed', type=int, default=0, help='随机种子')
+
+    def handle(self, *args, **options):
+        k = options['k']
+        recommender = KNNRecommender(
+            k_neighbors=k,
+            min_similarity=options['min_similarity'],
+            precompute_neighbors=False,
+            ann_index='',
+            ann_rank=options['rank']
+        )
+        if not recommender.fit():
+            raise CommandError('评分矩阵构建失败')
+
+        n_users = recommender.rating_matrix.shape[0]
+        rng = np.random.default_rng(options['seed'])
+        rated = np.flatnonzero(recommender.user_norms > 0)
+        queries = rng.choice(rated, min(options['queries'], len(rated)), replace=False)
+        self.stdout.write(f'用户数{n_users}，电影数{recommender.rating_matrix.shape[1]}，查询用户{len(queries)}个，K={k}')
+
+        # 精确扫描的结果作为基准
+        started = time.perf_counter()
+        truth = [set(recommender._compute_neighbors_by_index(int(user_idx), k)[0].tolist()) for user_idx in queries]
+        exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        self.stdout.write(f'精确扫描: 候选{n_users}个，平均{exact_ms:.2f}ms/次')
+
+        index_params = {
+            'ivf': {'n_lists': options['n_lists'], 'n_probe': options['n_probe'], 'seed': options['seed']},
+            'lsh': {'n_bits': options['n_bits'], 'n_tables': options['n_tables'], 'seed': options['seed']},
+        }
+
+        for kind in options['kind'] or list(INDEX_CLASSES):
+            started = time.perf_counter()
+            recommender.build_ann_index(create_index(kind, **index_params[kind]))
+            build_seconds = time.perf_counter() - started
+
+            candidate_counts = [len(recommender._ann_candidates(int(user_idx), k)) for user_idx in queries]
+
+            started = time.perf_counter()
+            found = [set(recommender._compute_neighbors_by_index(int(user_idx), k)[0].tolist()) for user_idx in queries]
+            query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+            recall = np.mean([
+                len(approx & exact) / len(exact) for approx, exact in zip(found, truth) if exact
+            ]) if any(truth) else 1.0
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{kind}: 召回率@{k} {recall:.3f}，平均候选{np.mean(candidate_counts):.0f}个'
+                f'（{np.mean(candidate_counts) / n_users:.1%}），平均{query_ms:.2f}ms/次，构建{build_seconds:.2f}秒'
+            ))
+
+        recommender.user_ann = None
@@ -0,0 +1,75 @@
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from movies.models import Movie
+from recommendations.services.content_features import content_feature_store
+from recommendations.services.similar_movies import (
+    compute_similar_movies,
+    save_similar_movies,
+    find_affected_movies
+)
+
+
+class Command(BaseCommand):
+    help = '预计算每部电影的前K个相似电影（基于内容特征），供相似电影接口直接读取'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=20, help='每部电影保留的相似电影数量')
+        parser.add_argument('--min-similarity', type=float, default=0.1, help='最小相似度阈值')
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='只计算从未计算过相似电影的电影，并更新受其影响的已有电影'
+        )
+        parser.add_argument('--workers', type=int, default=None, help='相似度计算的线程数，默认取配置')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='每个事务处理的电影数')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        # 电影数据可能刚由其他进程同步，重新构建特征
+        content_feature_store.invalidate()
+        features = content_feature_store.get()
+        if features is None:
+            raise CommandError('没有电影数据')
+
+        k, min_similarity = options['k'], options['min_similarity']
+
+        if options['incremental']:
+            # 按计算时间区分新电影，没有相似电影的电影计算过一次后不会被重复计算
+            computed = set(Movie.objects.filter(similar_computed_at__isnull=False).values_list('id', flat=True))
+            new_indices = np.array(
+                [idx for idx, movie_id in enumerate(features.movie_ids) if int(movie_id) not in computed],
+                dtype=np.int64
+            )
+            affected = find_affected_movies(features, new_indices, k, min_similarity, options['workers'])
+            movie_indices = np.concatenate([new_indices, affected])
+            self.stdout.write(f'新电影{len(new_indices)}部，受影响的已有电影{len(affected)}部')
+        else:
+            movie_indices = np.arange(len(features.movie_ids))
+
+        chunk_size = max(1, options['chunk_size'])
+        saved_movies = 0
+        saved_rows = 0
+
+        # 写入线程保存上一块的同时计算下一块，相似度计算（多线程内核）与数据库写入重叠进行
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='similar-movies-writer') as writer:
+            pending = None
+            for start in range(0, len(movie_indices), chunk_size):
+                chunk = movie_indices[start:start + chunk_size]
+                similar = compute_similar_movies(features, chunk, k, min_similarity, options['workers'])
+                if pending is not None:
+                    saved_rows += pending.result()
+                pending = writer.submit(save_similar_movies, similar)
+                saved_movies += len(similar)
+
+            if pending is not None:
+                saved_rows += pending.result()
+            writer.submit(connections.close_all).result()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'已为{saved_movies}部电影写入{saved_rows}条相似电影，总用时{time.monotonic() - started:.1f}秒'
+        ))
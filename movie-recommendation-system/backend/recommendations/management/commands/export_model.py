@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendations.models import RecommendationConfig
+from recommendations.services.knn_recommender import KNNRecommender
+from recommendations.services.model_registry import model_registry, RECOMMENDER_CLASSES
+
+
+class Command(BaseCommand):
+    help = '训练协同过滤模型并导出模型文件，供所有Web工作进程以内存映射方式共享加载'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--algorithm', choices=list(RECOMMENDER_CLASSES), default=KNNRecommender.algorithm,
+            help='协同过滤算法'
+        )
+        parser.add_argument('--k-neighbors', type=int, default=None, help='K近邻数量，默认取推荐配置')
+        parser.add_argument('--min-similarity', type=float, default=None, help='最小相似度阈值，默认取推荐配置')
+
+    def handle(self, *args, **options):
+        if not model_registry.model_dir:
+            raise CommandError('未配置RECOMMENDATION_MODEL_DIR')
+
+        config = RecommendationConfig.objects.filter(algorithm=options['algorithm'], is_active=True).first()
+        config_parameters = config.parameters if config else {}
+
+        k_neighbors = options['k_neighbors'] or config_parameters.get('k_neighbors', 20)
+        min_similarity = (
+            options['min_similarity'] if options['min_similarity'] is not None
+            else config_parameters.get('min_similarity', 0.1)
+        )
+
+        started = time.monotonic()
+        recommender = model_registry.get_model(
+            k_neighbors=k_neighbors,
+            min_similarity=min_similarity,
+            algorithm=options['algorithm'],
+            force_retrain=True
+        )
+        if recommender is None:
+            raise CommandError('模型训练失败')
+
+        key = model_registry.make_key(k_neighbors, min_similarity, options['algorithm'])
+        current, _ = model_registry.current_version(key)
+        if current != recommender.version:
+            raise CommandError('模型文件导出失败')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'模型版本{recommender.version}已导出到{model_registry.version_path(key, current)}，'
+            f'用时{time.monotonic() - started:.1f}秒'
+        ))
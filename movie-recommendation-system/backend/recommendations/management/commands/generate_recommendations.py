@@ -0,0 +1,155 @@
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from recommendations.models import RecommendationConfig
+from recommendations.services.knn_recommender import KNNRecommender
+from recommendations.services.model_registry import RECOMMENDER_CLASSES
+from recommendations.services.recommendation_state import ratings_watermarks, mark_generated
+from recommendations.services.batch_workers import init_worker, recommend_chunk
+
+
+class Command(BaseCommand):
+    help = '离线批量生成所有用户的KNN协同过滤推荐'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--algorithm', choices=list(RECOMMENDER_CLASSES), default=KNNRecommender.algorithm,
+            help='协同过滤算法'
+        )
+        parser.add_argument('--min-user-id', type=int, default=None, help='起始用户ID（包含）')
+        parser.add_argument('--max-user-id', type=int, default=None, help='结束用户ID（包含）')
+        parser.add_argument('--k-neighbors', type=int, default=None, help='K近邻数量，默认取推荐配置')
+        parser.add_argument('--min-similarity', type=float, default=None, help='最小相似度阈值，默认取推荐配置')
+        parser.add_argument('--n-recommendations', type=int, default=None, help='每个用户的推荐数量，默认取推荐配置')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='工作进程数')
+        parser.add_argument('--chunk-size', type=int, default=500, help='每个任务包含的用户数')
+        parser.add_argument('--batch-size', type=int, default=5000, help='每个事务写入的推荐条数')
+
+    def handle(self, *args, **options):
+        parameters, config_parameters = self._load_parameters(options)
+
+        # 训练之前读取评分水位线，训练之后的评分变化会使刷新接口重新计算
+        watermarks = ratings_watermarks() if config_parameters is not None else None
+
+        started = time.monotonic()
+        recommender = RECOMMENDER_CLASSES[options['algorithm']](
+            k_neighbors=parameters['k_neighbors'],
+            min_similarity=parameters['min_similarity']
+        )
+        if not recommender.fit():
+            raise CommandError('KNN模型训练失败')
+        self.stdout.write(f'模型训练完成，版本{recommender.version}，用时{time.monotonic() - started:.1f}秒')
+
+        user_indices = self._select_users(recommender, options['min_user_id'], options['max_user_id'])
+        if not user_indices:
+            self.stdout.write('没有需要生成推荐的用户')
+            return
+
+        chunk_size = max(1, options['chunk_size'])
+        chunks = [user_indices[i:i + chunk_size] for i in range(0, len(user_indices), chunk_size)]
+
+        # 工作进程从导出的模型文件以内存映射方式加载模型，fork与spawn启动方式都适用
+        artifact_dir = tempfile.mkdtemp(prefix='generate-recommendations-')
+        model_dir = os.path.join(artifact_dir, 'model')
+        recommender.export(model_dir)
+
+        # 子进程不使用数据库连接，fork前关闭以免共享同一连接
+        connections.close_all()
+
+        pending: Dict[int, List[Dict]] = {}
+        pending_rows = 0
+        saved_users = 0
+        saved_rows = 0
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=max(1, options['workers']),
+                initializer=init_worker,
+                initargs=(recommender.algorithm, model_dir)
+            ) as executor:
+                futures = [
+                    executor.submit(recommend_chunk, chunk, parameters['n_recommendations'])
+                    for chunk in chunks
+                ]
+                for future in futures:
+                    for user_id, recommendations in future.result():
+                        pending[user_id] = recommendations
+                        pending_rows += len(recommendations)
+
+                    if pending_rows >= options['batch_size']:
+                        saved_rows += self._save(recommender, pending, watermarks, config_parameters)
+                        saved_users += len(pending)
+                        pending, pending_rows = {}, 0
+        finally:
+            shutil.rmtree(artifact_dir, ignore_errors=True)
+
+        if pending:
+            saved_rows += self._save(recommender, pending, watermarks, config_parameters)
+            saved_users += len(pending)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'已为{saved_users}个用户生成{saved_rows}条推荐，总用时{time.monotonic() - started:.1f}秒'
+        ))
+
+    def _load_parameters(self, options: Dict) -> Tuple[Dict, Optional[Dict]]:
+        """
+        合并命令行参数与活跃推荐配置中的参数
+
+        Returns:
+            (生效的参数, 推荐配置的参数)，有活跃配置且生效参数与配置一致时才返回配置参数，
+            此时生成的推荐与刷新接口的结果相同，可以记录为最新状态
+        """
+        config = RecommendationConfig.objects.filter(algorithm=options['algorithm'], is_active=True).first()
+        config_parameters = config.parameters if config else {}
+
+        parameters = {
+            'k_neighbors': options['k_neighbors'] or config_parameters.get('k_neighbors', 20),
+            'min_similarity': (
+                options['min_similarity'] if options['min_similarity'] is not None
+                else config_parameters.get('min_similarity', 0.1)
+            ),
+            'n_recommendations': options['n_recommendations'] or config_parameters.get('n_recommendations', 10),
+        }
+
+        matches_config = config is not None and all(
+            config_parameters.get(name, default) == parameters[name]
+            for name, default in (('k_neighbors', 20), ('min_similarity', 0.1), ('n_recommendations', 10))
+        )
+        return parameters, (config_parameters if matches_config else None)
+
+    def _select_users(self, recommender: KNNRecommender, min_user_id, max_user_id) -> List[int]:
+        """选出ID范围内、在评分矩阵中的用户行下标"""
+        user_ids = recommender.user_ids
+        mask = np.ones(len(user_ids), dtype=bool)
+        if min_user_id is not None:
+            mask &= user_ids >= min_user_id
+        if max_user_id is not None:
+            mask &= user_ids <= max_user_id
+        return mask.nonzero()[0].tolist()
+
+    def _save(self, recommender: KNNRecommender, recommendations_by_user: Dict[int, List[Dict]],
+              watermarks: Optional[Dict[int, Dict]], config_parameters: Optional[Dict]) -> int:
+        """保存一批用户的推荐，并记录生成时的评分水位线（保存失败时抛出异常，不记录）"""
+        saved_rows = recommender.save_recommendations_bulk(recommendations_by_user, fail_silently=False)
+
+        if watermarks is not None:
+            # 推荐结果为空的用户不记录生成状态，刷新时重新计算
+            mark_generated(
+                {
+                    user_id: watermarks.get(user_id, {'count': 0, 'latest': None})
+                    for user_id, recommendations in recommendations_by_user.items()
+                    if recommendations
+                },
+                recommender.algorithm,
+                config_parameters
+            )
+
+        return saved_rows
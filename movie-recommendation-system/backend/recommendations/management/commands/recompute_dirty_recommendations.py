@@ -0,0 +1,141 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import UserRating
+from recommendations.models import DirtyUser, RecommendationConfig
+from recommendations.services.dirty_users import mark_dirty, next_dirty_batch, clear_dirty
+from recommendations.services.knn_recommender import KNNRecommender
+from recommendations.services.model_registry import model_registry, RECOMMENDER_CLASSES
+from recommendations.services.recommendation_state import ratings_watermarks, mark_generated
+
+
+class Command(BaseCommand):
+    help = '只为被标记为待更新的用户重新生成协同过滤推荐（按优先级顺序），处理完成后清除标记'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每个事务处理的用户数')
+        parser.add_argument('--limit', type=int, default=None, help='本次最多处理的用户数')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        # 只处理在此之前被标记的用户，处理期间的新变化留到下一次
+        claimed_at = timezone.now()
+
+        models = self._load_models()
+        if not models:
+            raise CommandError('KNN模型训练失败')
+
+        watermarks = self._sync_changed_users(models, claimed_at)
+
+        batch_size = max(1, options['batch_size'])
+        limit = options['limit']
+        processed_users = 0
+        saved_rows = 0
+
+        while limit is None or processed_users < limit:
+            size = batch_size if limit is None else min(batch_size, limit - processed_users)
+            user_ids = next_dirty_batch(claimed_at, size)
+            if not user_ids:
+                break
+
+            missing = [user_id for user_id in user_ids if user_id not in watermarks]
+            watermarks.update(ratings_watermarks(missing))
+            batch_watermarks = {user_id: watermarks[user_id] for user_id in user_ids}
+
+            results = [
+                (recommender, n_recommendations, config_parameters, {
+                    user_id: recommender.recommend_for_user(user_id, n_recommendations)
+                    for user_id in user_ids
+                })
+                for recommender, n_recommendations, config_parameters in models
+            ]
+
+            # 写入推荐与清除标记在同一事务中完成，中途失败时这批用户仍保持待更新
+            with transaction.atomic():
+                for recommender, n_recommendations, config_parameters, recommendations_by_user in results:
+                    saved_rows += recommender.save_recommendations_bulk(recommendations_by_user, fail_silently=False)
+                    if config_parameters is not None:
+                        # 推荐结果为空的用户不记录生成状态，刷新时重新计算
+                        mark_generated(
+                            {
+                                user_id: batch_watermarks[user_id]
+                                for user_id, recommendations in recommendations_by_user.items()
+                                if recommendations
+                            },
+                            recommender.algorithm,
+                            config_parameters
+                        )
+                clear_dirty(user_ids, claimed_at)
+
+            processed_users += len(user_ids)
+
+        remaining = DirtyUser.objects.count()
+        self.stdout.write(self.style.SUCCESS(
+            f'已为{processed_users}个用户重新生成{saved_rows}条推荐，剩余待更新用户{remaining}个，'
+            f'总用时{time.monotonic() - started:.1f}秒'
+        ))
+
+    def _load_models(self) -> List[Tuple[KNNRecommender, int, Optional[Dict]]]:
+        """
+        加载活跃推荐配置对应的协同过滤模型
+
+        Returns:
+            [(推荐器, 推荐数量, 推荐配置的参数)]，没有活跃配置时使用默认参数的用户KNN模型，
+            此时配置参数为None，不记录推荐状态
+        """
+        configs = [
+            (config.algorithm, config.parameters)
+            for config in RecommendationConfig.objects.filter(is_active=True, algorithm__in=list(RECOMMENDER_CLASSES))
+        ] or [(KNNRecommender.algorithm, None)]
+
+        models = []
+        for algorithm, config_parameters in configs:
+            parameters = config_parameters or {}
+            recommender = model_registry.get_model(
+                k_neighbors=parameters.get('k_neighbors', 20),
+                min_similarity=parameters.get('min_similarity', 0.1),
+                algorithm=algorithm
+            )
+            if recommender is None:
+                return []
+            models.append((recommender, parameters.get('n_recommendations', 10), config_parameters))
+        return models
+
+    def _sync_changed_users(self, models: List[Tuple[KNNRecommender, int, Optional[Dict]]],
+                            claimed_at) -> Dict[int, Dict]:
+        """
+        把评分变化的用户的最新评分同步到模型，并按邻居图标记依赖这些用户的邻居
+
+        Returns:
+            同步评分之前读取的这些用户的评分水位线
+        """
+        changed = list(
+            DirtyUser.objects.filter(ratings_changed=True, dirtied_at__lte=claimed_at)
+            .values_list('user_id', flat=True)
+        )
+        if not changed:
+            return {}
+
+        # 先读水位线再读评分，其间的评分变化会使刷新接口重新计算
+        watermarks = ratings_watermarks(changed)
+
+        ratings_by_user = {user_id: {} for user_id in changed}
+        for user_id, movie_id, rating in UserRating.objects.filter(user_id__in=changed).values_list(
+                'user_id', 'movie_id', 'rating'):
+            ratings_by_user[user_id][movie_id] = rating
+
+        dependents = set()
+        for recommender, _, _ in models:
+            recommender.set_user_ratings(ratings_by_user)
+            dependents.update(recommender.get_dependent_users(changed))
+
+        # 邻居的标记时间取claimed_at，本次即可处理；已有更晚标记的邻居保持不变
+        mark_dirty(dependents - set(changed), DirtyUser.PRIORITY_NEIGHBOR, dirtied_at=claimed_at)
+        self.stdout.write(f'评分变化的用户{len(changed)}个，受影响的邻居用户{len(dependents - set(changed))}个')
+
+        return watermarks
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recommendations.services.training_jobs import claim_next_job, run_training_job
+
+
+class Command(BaseCommand):
+    help = '后台训练工作进程：轮询数据库中的训练任务队列并逐个执行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='队列为空时的轮询间隔（秒）')
+        parser.add_argument('--once', action='store_true', help='执行完当前排队的任务后退出')
+
+    def handle(self, *args, **options):
+        self.stdout.write('训练工作进程已启动')
+
+        while True:
+            # 长时间运行的进程需要自行回收失效的数据库连接
+            close_old_connections()
+
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'开始训练任务#{job.id}: {job.algorithm} {job.parameters}')
+            started = time.monotonic()
+
+            if run_training_job(job):
+                self.stdout.write(self.style.SUCCESS(
+                    f'训练任务#{job.id}完成，模型版本{job.model_version}，用时{time.monotonic() - started:.1f}秒'
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(f'训练任务#{job.id}失败: {job.error}'))
@@ -0,0 +1,20 @@
+# Generated by Django 4.2 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommendations", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recommendation",
+            name="model_version",
+            field=models.CharField(
+                blank=True, default="", max_length=32, verbose_name="模型版本"
+            ),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 4.2 on 2026-10-18 04:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recommendations", "0002_recommendation_model_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrainingJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("algorithm", models.CharField(max_length=50, verbose_name="推荐算法")),
+                ("parameters", models.JSONField(default=dict, verbose_name="训练参数")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "排队中"),
+                            ("running", "训练中"),
+                            ("succeeded", "已完成"),
+                            ("failed", "失败"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                        verbose_name="状态",
+                    ),
+                ),
+                (
+                    "stage",
+                    models.CharField(
+                        blank=True, max_length=30, verbose_name="当前阶段"
+                    ),
+                ),
+                (
+                    "stages",
+                    models.JSONField(
+                        default=list,
+                        help_text='[{"stage", "started_at", "duration"}]',
+                        verbose_name="阶段耗时",
+                    ),
+                ),
+                (
+                    "model_version",
+                    models.CharField(
+                        blank=True, max_length=32, verbose_name="模型版本"
+                    ),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="错误信息")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="创建时间"),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="开始时间"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="结束时间"
+                    ),
+                ),
+                (
+                    "requested_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="training_jobs",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="发起用户",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "训练任务",
+                "verbose_name_plural": "训练任务",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="trainingjob",
+            index=models.Index(
+                fields=["status", "created_at"], name="recommendat_status_1990a5_idx"
+            ),
+        ),
+    ]
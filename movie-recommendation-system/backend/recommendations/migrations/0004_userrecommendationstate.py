@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-18 05:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recommendations", "0003_trainingjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserRecommendationState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("algorithm", models.CharField(max_length=50, verbose_name="推荐算法")),
+                ("parameters", models.JSONField(default=dict, verbose_name="算法参数")),
+                (
+                    "ratings_count",
+                    models.IntegerField(default=0, verbose_name="评分数量"),
+                ),
+                (
+                    "ratings_updated_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="最近评分时间"
+                    ),
+                ),
+                (
+                    "generated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="生成时间"),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recommendation_states",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="用户",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "用户推荐状态",
+                "verbose_name_plural": "用户推荐状态",
+                "unique_together": {("user", "algorithm")},
+            },
+        ),
+    ]
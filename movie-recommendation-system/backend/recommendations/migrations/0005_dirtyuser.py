@@ -0,0 +1,53 @@
+# Generated by Django 4.2 on 2026-10-18 05:06
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("recommendations", "0004_userrecommendationstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DirtyUser",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="recommendation_dirty_flag",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="用户",
+                    ),
+                ),
+                (
+                    "priority",
+                    models.PositiveSmallIntegerField(default=1, verbose_name="优先级"),
+                ),
+                (
+                    "ratings_changed",
+                    models.BooleanField(default=False, verbose_name="评分是否变化"),
+                ),
+                ("dirtied_at", models.DateTimeField(verbose_name="最近标记时间")),
+            ],
+            options={
+                "verbose_name": "待更新推荐用户",
+                "verbose_name_plural": "待更新推荐用户",
+                "ordering": ["-priority", "dirtied_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="dirtyuser",
+            index=models.Index(
+                fields=["-priority", "dirtied_at"],
+                name="recommendat_priorit_712099_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recommendations", "0005_dirtyuser"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trainingjob",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0, verbose_name="执行次数"),
+        ),
+        migrations.AddField(
+            model_name="trainingjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="执行中的工作进程定期更新，超时未更新视为进程已中断",
+                null=True,
+                verbose_name="心跳时间",
+            ),
+        ),
+    ]
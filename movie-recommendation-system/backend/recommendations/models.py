@@ -10,6 +10,7 @@ class Recommendation(models.Model):
     score = models.FloatField(verbose_name='推荐分数', help_text='0-1之间的推荐分数')
     algorithm = models.CharField(max_length=50, verbose_name='推荐算法')
     reason = models.TextField(verbose_name='推荐理由', blank=True)
+    model_version = models.CharField(max_length=32, verbose_name='模型版本', blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
     
     class Meta:
@@ -22,6 +23,24 @@ class Recommendation(models.Model):
         return f'{self.user.username} - {self.movie.title}: {self.score:.3f}'
 
 
+class UserRecommendationState(models.Model):
+    """用户推荐结果的生成状态：生成时的评分水位线与参数，用于判断已保存的推荐是否仍然有效"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, verbose_name='用户', related_name='recommendation_states')
+    algorithm = models.CharField(max_length=50, verbose_name='推荐算法')
+    parameters = models.JSONField(verbose_name='算法参数', default=dict)
+    ratings_count = models.IntegerField(verbose_name='评分数量', default=0)
+    ratings_updated_at = models.DateTimeField(verbose_name='最近评分时间', null=True, blank=True)
+    generated_at = models.DateTimeField(auto_now=True, verbose_name='生成时间')
+    
+    class Meta:
+        verbose_name = '用户推荐状态'
+        verbose_name_plural = '用户推荐状态'
+        unique_together = ['user', 'algorithm']
+    
+    def __str__(self):
+        return f'{self.user_id} - {self.algorithm}: {self.ratings_count}'
+
+
 class RecommendationConfig(models.Model):
     """推荐系统配置"""
     name = models.CharField(max_length=100, unique=True, verbose_name='配置名称')
@@ -38,4 +57,72 @@ class RecommendationConfig(models.Model):
         ordering = ['-is_active', 'name']
     
     def __str__(self):
-        return f'{self.name} ({self.algorithm})'
\ No newline at end of file
+        return f'{self.name} ({self.algorithm})'
+
+
+class TrainingJob(models.Model):
+    """模型训练任务（数据库队列，由run_training_worker命令执行）"""
+    STATUS_CHOICES = [
+        ('pending', '排队中'),
+        ('running', '训练中'),
+        ('succeeded', '已完成'),
+        ('failed', '失败'),
+    ]
+    
+    algorithm = models.CharField(max_length=50, verbose_name='推荐算法')
+    parameters = models.JSONField(verbose_name='训练参数', default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    stage = models.CharField(max_length=30, verbose_name='当前阶段', blank=True)
+    stages = models.JSONField(verbose_name='阶段耗时', default=list, help_text='[{"stage", "started_at", "duration"}]')
+    model_version = models.CharField(max_length=32, verbose_name='模型版本', blank=True)
+    error = models.TextField(verbose_name='错误信息', blank=True)
+    requested_by = models.ForeignKey(
+        CustomUser, on_delete=models.SET_NULL, null=True, blank=True,
+        verbose_name='发起用户', related_name='training_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    heartbeat_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='心跳时间', help_text='执行中的工作进程定期更新，超时未更新视为进程已中断'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='执行次数')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='结束时间')
+    
+    class Meta:
+        verbose_name = '训练任务'
+        verbose_name_plural = '训练任务'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f'{self.algorithm} #{self.id} ({self.status})'
+
+
+class DirtyUser(models.Model):
+    """推荐结果需要重新计算的用户（由recompute_dirty_recommendations命令处理）"""
+    # 优先级越高越先处理：自身评分变化 > 邻居评分变化、待看列表变化 > 其他交互
+    PRIORITY_INTERACTION = 1
+    PRIORITY_WATCHLIST = 2
+    PRIORITY_NEIGHBOR = 2
+    PRIORITY_RATINGS = 3
+    
+    user = models.OneToOneField(
+        CustomUser, on_delete=models.CASCADE, primary_key=True,
+        verbose_name='用户', related_name='recommendation_dirty_flag'
+    )
+    priority = models.PositiveSmallIntegerField(default=PRIORITY_INTERACTION, verbose_name='优先级')
+    ratings_changed = models.BooleanField(default=False, verbose_name='评分是否变化')
+    dirtied_at = models.DateTimeField(verbose_name='最近标记时间')
+    
+    class Meta:
+        verbose_name = '待更新推荐用户'
+        verbose_name_plural = '待更新推荐用户'
+        ordering = ['-priority', 'dirtied_at']
+        indexes = [
+            models.Index(fields=['-priority', 'dirtied_at']),
+        ]
+    
+    def __str__(self):
+        return f'{self.user_id} ({self.priority})'
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from django.core.validators import MinValueValidator, MaxValueValidator
 
-from .models import Recommendation, RecommendationConfig
+from .models import Recommendation, RecommendationConfig, TrainingJob
 from movies.serializers import MovieSerializer
 from users.serializers import UserProfileSerializer
 
@@ -15,9 +15,9 @@ class RecommendationSerializer(serializers.ModelSerializer):
         model = Recommendation
         fields = [
             'id', 'user', 'movie', 'score', 'algorithm',
-            'reason', 'created_at'
+            'reason', 'model_version', 'created_at'
         ]
-        read_only_fields = ['created_at']
+        read_only_fields = ['model_version', 'created_at']
 
 
 class RecommendationConfigSerializer(serializers.ModelSerializer):
@@ -41,6 +41,8 @@ class RecommendationConfigSerializer(serializers.ModelSerializer):
         """验证算法类型"""
         valid_algorithms = [
             'knn_collaborative_filtering',
+            'item_knn_collaborative_filtering',
+            'als_matrix_factorization',
             'knn_content_based',
             'popularity_based',
             'hybrid'
@@ -55,6 +57,11 @@ class RecommendationConfigSerializer(serializers.ModelSerializer):
 
 class KNNRecommendationSerializer(serializers.Serializer):
     """KNN推荐参数序列化器"""
+    algorithm = serializers.ChoiceField(
+        choices=['knn_collaborative_filtering', 'item_knn_collaborative_filtering', 'als_matrix_factorization'],
+        default='knn_collaborative_filtering',
+        help_text='协同过滤算法'
+    )
     k_neighbors = serializers.IntegerField(
         default=20,
         min_value=1,
@@ -89,6 +96,34 @@ class KNNRecommendationSerializer(serializers.Serializer):
         return data
 
 
+class TrainingJobSerializer(serializers.ModelSerializer):
+    """训练任务序列化器"""
+
+    class Meta:
+        model = TrainingJob
+        fields = [
+            'id', 'algorithm', 'parameters', 'status', 'stage', 'stages',
+            'model_version', 'error', 'attempts', 'created_at', 'started_at', 'heartbeat_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
+class ModelVersionSerializer(serializers.Serializer):
+    """模型版本查询/回滚参数序列化器"""
+    algorithm = serializers.ChoiceField(
+        choices=['knn_collaborative_filtering', 'item_knn_collaborative_filtering', 'als_matrix_factorization'],
+        default='knn_collaborative_filtering',
+        help_text='协同过滤算法'
+    )
+    k_neighbors = serializers.IntegerField(default=20, min_value=1, max_value=100, help_text='K近邻数量')
+    min_similarity = serializers.FloatField(default=0.1, min_value=0.0, max_value=1.0, help_text='最小相似度阈值')
+    version = serializers.RegexField(
+        r'^\d{14}-[0-9a-f]{6}$',
+        required=False,
+        help_text='目标版本，默认为上一个版本'
+    )
+
+
 class MovieRecommendationSerializer(serializers.Serializer):
     """电影推荐序列化器"""
     movie_id = serializers.IntegerField(required=True)
@@ -100,6 +135,9 @@ class UserRecommendationSerializer(serializers.Serializer):
     user_id = serializers.IntegerField(required=True)
     n_recommendations = serializers.IntegerField(default=10, min_value=1, max_value=20)
     algorithm = serializers.ChoiceField(
-        choices=['knn_collaborative_filtering', 'knn_content_based', 'hybrid'],
+        choices=[
+            'knn_collaborative_filtering', 'item_knn_collaborative_filtering', 'als_matrix_factorization',
+            'knn_content_based', 'hybrid'
+        ],
         default='knn_collaborative_filtering'
     )
\ No newline at end of file
@@ -0,0 +1,311 @@
+import os
+import json
+import numpy as np
+from typing import Dict, Optional, Tuple
+from scipy.sparse import csr_matrix
+
+# 分块计算向量与聚类中心相似度时每块的行数
+_BLOCK_ROWS = 4096
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """按行L2归一化为float32（零向量保持为零），归一化后内积即为余弦相似度"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return vectors * inverse[:, None]
+
+
+class VectorIndex:
+    """近似最近邻索引的公共接口（余弦相似度，纯NumPy实现）
+
+    build/add时保存归一化后的向量，query先由子类给出候选集合，
+    再在候选上精确计算相似度取前K，候选集合的大小决定查询成本与召回率。
+    返回的是向量的行号（即加入索引的顺序），由调用方映射回用户或电影。
+
+    索引数组整体替换而不原地修改，add期间的并发查询看到的总是完整的旧索引或新索引。
+    """
+
+    kind = None
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        self.vectors = None
+
+    @property
+    def size(self) -> int:
+        """索引中的向量数量"""
+        return 0 if self.vectors is None else len(self.vectors)
+
+    def params(self) -> Dict:
+        """保存到index.json的构造参数"""
+        return {'seed': self.seed}
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """save时写入.npy文件的数组"""
+        return {'vectors': self.vectors}
+
+    def build(self, vectors: np.ndarray) -> 'VectorIndex':
+        """用一组向量构建索引"""
+        self.vectors = _normalize(vectors)
+        self._build()
+        return self
+
+    def add(self, vectors: np.ndarray):
+        """增量加入向量，行号接在已有向量之后，不重新训练量化器/哈希函数"""
+        if self.vectors is None:
+            self.build(vectors)
+            return
+        new = _normalize(vectors)
+        if len(new) == 0:
+            return
+        start = self.size
+        # 先扩展向量再更新候选结构，查询拿到的行号总在向量范围内
+        self.vectors = np.vstack([self.vectors, new])
+        self._add(new, start)
+
+    def update(self, positions: np.ndarray, vectors: np.ndarray):
+        """替换已有行号的向量（如评分变化后的用户嵌入），不重新训练量化器/哈希函数"""
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0:
+            return
+        new = _normalize(vectors)
+        replaced = np.array(self.vectors)
+        replaced[positions] = new
+        self.vectors = replaced
+        self._update(positions, new)
+
+    def query(self, vector: np.ndarray, k: int, **options) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        查询与vector最相似的k个向量
+
+        Returns:
+            (行号数组, 余弦相似度数组)，按相似度降序
+        """
+        query = _normalize(np.asarray(vector).reshape(1, -1))[0]
+        candidates = self._candidates(query, **options)
+        if len(candidates) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        similarities = self.vectors[candidates] @ query
+        if len(candidates) > k:
+            top = np.argpartition(-similarities, k - 1)[:k]
+            candidates, similarities = candidates[top], similarities[top]
+
+        order = np.argsort(-similarities, kind='stable')
+        return candidates[order], similarities[order]
+
+    def save(self, directory: str):
+        """保存为目录：每个数组一个.npy文件，类型与参数写入index.json"""
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self.arrays().items():
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(directory, 'index.json'), 'w', encoding='utf-8') as f:
+            json.dump({'kind': self.kind, 'params': self.params()}, f)
+
+    @staticmethod
+    def load(directory: str, mmap_mode: Optional[str] = 'r') -> 'VectorIndex':
+        """从目录加载索引，默认以只读内存映射方式加载数组"""
+        with open(os.path.join(directory, 'index.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+
+        index = INDEX_CLASSES[meta['kind']](**meta['params'])
+        for name in index.arrays():
+            setattr(index, name, np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode))
+        return index
+
+    def _build(self):
+        raise NotImplementedError
+
+    def _add(self, new: np.ndarray, start: int):
+        raise NotImplementedError
+
+    def _update(self, positions: np.ndarray, new: np.ndarray):
+        raise NotImplementedError
+
+    def _candidates(self, query: np.ndarray, **options) -> np.ndarray:
+        raise NotImplementedError
+
+
+class IVFIndex(VectorIndex):
+    """倒排文件索引（IVF）：球面k-means粗量化，查询时只扫描最相近的n_probe个聚类"""
+
+    kind = 'ivf'
+
+    def __init__(self, n_lists: int = 0, n_probe: int = 8, n_iter: int = 10, seed: int = 0):
+        """
+        Args:
+            n_lists: 聚类数量，为0时取向量数的平方根
+            n_probe: 查询时扫描的聚类数量，越大召回率越高、查询越慢
+            n_iter: k-means迭代次数
+            seed: 随机种子
+        """
+        super().__init__(seed)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.centroids = None
+        self.assignments = None
+        self.list_indptr = None
+        self.list_members = None
+
+    def params(self) -> Dict:
+        return {'n_lists': self.n_lists, 'n_probe': self.n_probe, 'n_iter': self.n_iter, 'seed': self.seed}
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            'vectors': self.vectors, 'centroids': self.centroids, 'assignments': self.assignments,
+            'list_indptr': self.list_indptr, 'list_members': self.list_members,
+        }
+
+    def _build(self):
+        vectors = self.vectors
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(len(vectors)))), max(len(vectors), 1))
+        self.n_lists = n_lists
+        rng = np.random.default_rng(self.seed)
+
+        # 聚类中心只在采样上训练，每个聚类约256个样本即可
+        sample_size = min(len(vectors), 256 * n_lists)
+        sample = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(self.n_iter):
+            assignments = self._assign(sample, centroids)
+            indicator = csr_matrix(
+                (np.ones(sample_size, dtype=np.float32), (assignments, np.arange(sample_size))),
+                shape=(n_lists, sample_size)
+            )
+            sums = np.asarray(indicator @ sample)
+            # 空聚类重新取一个随机样本作为中心
+            empty = np.flatnonzero(np.bincount(assignments, minlength=n_lists) == 0)
+            sums[empty] = sample[rng.choice(sample_size, len(empty))]
+            centroids = _normalize(sums)
+
+        self.centroids = centroids
+        self._set_assignments(self._assign(vectors, centroids))
+
+    def _add(self, new: np.ndarray, start: int):
+        self._set_assignments(np.concatenate([self.assignments, self._assign(new, self.centroids)]))
+
+    def _update(self, positions: np.ndarray, new: np.ndarray):
+        assignments = np.array(self.assignments)
+        assignments[positions] = self._assign(new, self.centroids)
+        self._set_assignments(assignments)
+
+    def _set_assignments(self, assignments: np.ndarray):
+        """按所属聚类整理倒排表：list_members[list_indptr[c]:list_indptr[c+1]]为第c个聚类的向量"""
+        counts = np.bincount(assignments, minlength=len(self.centroids))
+        list_indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        list_members = np.argsort(assignments, kind='stable').astype(np.int64)
+        self.list_indptr, self.list_members, self.assignments = list_indptr, list_members, assignments
+
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """分块把向量分配到最相似的聚类中心"""
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), _BLOCK_ROWS):
+            block = vectors[start:start + _BLOCK_ROWS]
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def _candidates(self, query: np.ndarray, n_probe: Optional[int] = None) -> np.ndarray:
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        scores = self.centroids @ query
+        probes = np.argpartition(-scores, n_probe - 1)[:n_probe]
+        indptr, members = self.list_indptr, self.list_members
+        return np.concatenate([members[indptr[probe]:indptr[probe + 1]] for probe in probes])
+
+
+class LSHIndex(VectorIndex):
+    """随机超平面局部敏感哈希（LSH）索引
+
+    每张哈希表用n_bits个随机超平面把向量编码为整数，夹角越小的向量越可能落在同一个桶。
+    查询时在每张表中查找同一个桶以及只差一位的相邻桶（多探针），合并为候选集合。
+
+    候选数量相近时召回率低于IVF（需要更多哈希表才能达到相同的召回率），
+    上线前应先用benchmark_ann_index对比精确扫描的召回率@K。
+    """
+
+    kind = 'lsh'
+
+    def __init__(self, n_bits: int = 0, n_tables: int = 16, multi_probe: bool = True, seed: int = 0):
+        """
+        Args:
+            n_bits: 每张表的哈希位数，越大桶越小、查询越快、召回率越低，为0时按每个桶约8个向量选取
+            n_tables: 哈希表数量，越多召回率越高
+            multi_probe: 是否同时查找只差一位的相邻桶
+            seed: 随机种子
+        """
+        super().__init__(seed)
+        self.n_bits = n_bits
+        self.n_tables = n_tables
+        self.multi_probe = multi_probe
+        self.planes = None
+        self.codes = None
+        self.orders = None
+        self.sorted_codes = None
+
+    def params(self) -> Dict:
+        return {'n_bits': self.n_bits, 'n_tables': self.n_tables, 'multi_probe': self.multi_probe, 'seed': self.seed}
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            'vectors': self.vectors, 'planes': self.planes, 'codes': self.codes,
+            'orders': self.orders, 'sorted_codes': self.sorted_codes,
+        }
+
+    def _build(self):
+        if not self.n_bits:
+            self.n_bits = int(np.clip(round(np.log2(max(len(self.vectors), 1) / 8)), 4, 16))
+        rng = np.random.default_rng(self.seed)
+        dimension = self.vectors.shape[1]
+        self.planes = rng.standard_normal((self.n_tables, self.n_bits, dimension)).astype(np.float32)
+        self._set_codes(self._hash(self.vectors))
+
+    def _add(self, new: np.ndarray, start: int):
+        self._set_codes(np.concatenate([self.codes, self._hash(new)], axis=1))
+
+    def _update(self, positions: np.ndarray, new: np.ndarray):
+        codes = np.array(self.codes)
+        codes[:, positions] = self._hash(new)
+        self._set_codes(codes)
+
+    def _set_codes(self, codes: np.ndarray):
+        """每张表按哈希值排序，查询时二分查找桶的范围"""
+        orders = np.argsort(codes, axis=1, kind='stable')
+        self.sorted_codes = np.take_along_axis(codes, orders, axis=1)
+        self.orders, self.codes = orders, codes
+
+    def _hash(self, vectors: np.ndarray) -> np.ndarray:
+        """计算每张表中的哈希值，返回 n_tables × n_vectors 的int64数组"""
+        weights = np.int64(1) << np.arange(self.n_bits, dtype=np.int64)
+        return np.stack([((vectors @ planes.T) > 0) @ weights for planes in self.planes])
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray:
+        codes = self._hash(query[None, :])[:, 0]
+        flips = np.int64(1) << np.arange(self.n_bits, dtype=np.int64) if self.multi_probe else np.empty(0, dtype=np.int64)
+
+        members = []
+        for table, code in enumerate(codes):
+            probes = np.concatenate([[code], code ^ flips])
+            lows = np.searchsorted(self.sorted_codes[table], probes, side='left')
+            highs = np.searchsorted(self.sorted_codes[table], probes, side='right')
+            members.extend(self.orders[table][low:high] for low, high in zip(lows, highs) if high > low)
+
+        if not members:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(members))
+
+
+# 可选的近似最近邻索引类型
+INDEX_CLASSES = {
+    IVFIndex.kind: IVFIndex,
+    LSHIndex.kind: LSHIndex,
+}
+
+
+def create_index(kind: str, **params) -> VectorIndex:
+    """按类型创建未构建的索引"""
+    if kind not in INDEX_CLASSES:
+        raise ValueError(f'不支持的近似最近邻索引类型: {kind}')
+    return INDEX_CLASSES[kind](**params)
@@ -0,0 +1,35 @@
+import django
+from typing import Dict, List, Tuple
+from django.apps import apps
+
+# 工作进程中共享的只读模型
+_worker_recommender = None
+
+
+def init_worker(algorithm: str, directory: str):
+    """
+    批量生成推荐的工作进程初始化
+
+    本模块导入时不访问模型类，spawn方式启动的子进程（Windows/macOS）也能导入；
+    子进程先完成django.setup()，再以只读内存映射加载父进程导出的模型文件，
+    同一台机器上的所有工作进程共享一份页缓存，不需要pickle整个模型。
+
+    Args:
+        algorithm: 协同过滤算法
+        directory: 父进程导出的模型文件目录
+    """
+    global _worker_recommender
+    if not apps.ready:
+        django.setup()
+
+    from recommendations.services.model_registry import RECOMMENDER_CLASSES
+    _worker_recommender = RECOMMENDER_CLASSES[algorithm].load(directory)
+
+
+def recommend_chunk(user_indices: List[int], n_recommendations: int) -> List[Tuple[int, List[Dict]]]:
+    """在工作进程中为一批用户生成推荐，不访问数据库"""
+    results = []
+    for user_idx in user_indices:
+        user_id = int(_worker_recommender.user_ids[user_idx])
+        results.append((user_id, _worker_recommender._recommend_by_index(user_idx, n_recommendations)))
+    return results
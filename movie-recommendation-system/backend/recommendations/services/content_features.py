@@ -0,0 +1,107 @@
+import time
+import threading
+import numpy as np
+import logging
+from typing import Dict, NamedTuple, Optional
+from django.conf import settings
+from sklearn.preprocessing import StandardScaler
+
+from movies.models import Movie
+from recommendations.services.similarity import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+class ContentFeatures(NamedTuple):
+    """电影内容特征矩阵（每行已L2归一化，行内积即为余弦相似度）"""
+    matrix: np.ndarray
+    movie_ids: np.ndarray
+    movie_index: Dict[int, int]
+
+
+class ContentFeatureStore:
+    """进程级电影内容特征缓存
+
+    特征由标准化后的数值字段（流行度、评分、评分人数、片长）与类型one-hot组成，
+    构建一次后缓存在内存中。电影或类型变化时由信号使缓存失效，
+    其他进程（如数据导入命令）的修改在超过最长使用时间后生效。
+    """
+
+    NUMERIC_FIELDS = ('popularity', 'vote_average', 'vote_count', 'runtime')
+
+    def __init__(self, max_age: Optional[int] = None):
+        """
+        初始化特征缓存
+
+        Args:
+            max_age: 特征矩阵最长使用时间（秒），默认取RECOMMENDATION_CONTENT_FEATURES_MAX_AGE
+        """
+        self.max_age = (
+            max_age if max_age is not None
+            else getattr(settings, 'RECOMMENDATION_CONTENT_FEATURES_MAX_AGE', 3600)
+        )
+        self._features: Optional[ContentFeatures] = None
+        self._built_at = 0.0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[ContentFeatures]:
+        """获取特征矩阵，缓存失效或过期时重新构建；没有电影时返回None"""
+        features = self._features
+        if features is not None and time.monotonic() - self._built_at < self.max_age:
+            return features
+
+        with self._lock:
+            features = self._features
+            if features is not None and time.monotonic() - self._built_at < self.max_age:
+                return features
+
+            version = self._version
+            built_at = time.monotonic()
+            features = self._build()
+
+            # 构建期间发生变化时本次结果不缓存，下次请求重新构建
+            if version == self._version:
+                self._features = features
+                self._built_at = built_at
+
+            return features
+
+    def invalidate(self):
+        """使缓存的特征矩阵失效"""
+        self._version += 1
+        self._features = None
+
+    def _build(self) -> Optional[ContentFeatures]:
+        """从数据库构建特征矩阵（两次查询：数值字段与电影-类型关联）"""
+        rows = list(Movie.objects.values_list('id', *self.NUMERIC_FIELDS).order_by('id'))
+        if not rows:
+            return None
+
+        movie_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        numeric = np.array(
+            [[value or 0.0 for value in row[1:]] for row in rows],
+            dtype=np.float64
+        )
+        numeric = StandardScaler().fit_transform(numeric)
+
+        # 类型one-hot，直接读取多对多中间表，避免逐部电影查询
+        links = np.array(
+            list(Movie.genres.through.objects.values_list('movie_id', 'genre_id').order_by()),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        # 两次查询之间新增的电影不在本次特征中
+        links = links[np.isin(links[:, 0], movie_ids)]
+        genre_ids, genre_columns = np.unique(links[:, 1], return_inverse=True)
+        genres = np.zeros((len(movie_ids), len(genre_ids)), dtype=np.float64)
+        genres[np.searchsorted(movie_ids, links[:, 0]), genre_columns] = 1.0
+
+        matrix = normalize_rows(np.hstack([numeric, genres])).astype(np.float32)
+        movie_index = {int(movie_id): idx for idx, movie_id in enumerate(movie_ids)}
+
+        logger.info(f'电影内容特征构建完成，电影数: {len(movie_ids)}，特征维度: {matrix.shape[1]}')
+        return ContentFeatures(matrix, movie_ids, movie_index)
+
+
+# 进程级共享的电影内容特征缓存
+content_feature_store = ContentFeatureStore()
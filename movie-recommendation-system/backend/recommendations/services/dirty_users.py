@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Iterable, List, Optional
+from django.db.models import Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from recommendations.models import DirtyUser
+
+
+def mark_dirty(user_ids: Iterable[int], priority: int, ratings_changed: bool = False,
+               dirtied_at: Optional[datetime] = None):
+    """
+    标记用户的推荐结果需要重新计算
+
+    已标记的用户保留较高的优先级，标记时间只会向后推移：
+    重新计算时只清除标记时间不晚于开始时间的标记，计算期间的新变化会留到下一次处理。
+
+    Args:
+        user_ids: 用户ID
+        priority: 优先级（DirtyUser.PRIORITY_*）
+        ratings_changed: 用户自身的评分是否变化（重新计算前需同步评分并扩散到邻居）
+        dirtied_at: 标记时间，默认为当前时间
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    dirtied_at = dirtied_at or timezone.now()
+    DirtyUser.objects.bulk_create(
+        [
+            DirtyUser(user_id=user_id, priority=priority, ratings_changed=ratings_changed, dirtied_at=dirtied_at)
+            for user_id in user_ids
+        ],
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+    fields = {
+        'priority': Greatest('priority', Value(priority)),
+        'dirtied_at': Greatest('dirtied_at', Value(dirtied_at)),
+    }
+    if ratings_changed:
+        fields['ratings_changed'] = True
+    DirtyUser.objects.filter(user_id__in=user_ids).update(**fields)
+
+
+def next_dirty_batch(claimed_at: datetime, batch_size: int) -> List[int]:
+    """按优先级顺序取出一批在claimed_at之前被标记的用户"""
+    return list(
+        DirtyUser.objects.filter(dirtied_at__lte=claimed_at)
+        .order_by('-priority', 'dirtied_at', 'user_id')
+        .values_list('user_id', flat=True)[:batch_size]
+    )
+
+
+def clear_dirty(user_ids: Iterable[int], claimed_at: datetime) -> int:
+    """清除已处理用户的标记，claimed_at之后再次被标记的用户保留"""
+    deleted, _ = DirtyUser.objects.filter(user_id__in=list(user_ids), dirtied_at__lte=claimed_at).delete()
+    return deleted
@@ -0,0 +1,76 @@
+import numpy as np
+from typing import Tuple, Union
+from scipy.sparse import csr_matrix, issparse
+
+Matrix = Union[np.ndarray, csr_matrix]
+
+
+def randomized_svd(matrix: Matrix, rank: int, n_oversamples: int = 10, n_iter: int = 4,
+                   seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    随机化截断SVD（Halko等的随机投影加幂迭代），只需稀疏矩阵与稠密矩阵的乘法
+
+    Args:
+        matrix: 待分解的矩阵（稠密或稀疏）
+        rank: 保留的奇异值数量
+        n_oversamples: 额外采样的维数，提高精度
+        n_iter: 幂迭代次数，奇异值衰减较慢时需要更多次
+        seed: 随机种子
+
+    Returns:
+        (U, s, Vt)，s按降序排列
+    """
+    n_rows, n_columns = matrix.shape
+    rank = max(1, min(rank, n_rows, n_columns))
+    n_samples = min(rank + n_oversamples, n_rows, n_columns)
+    rng = np.random.default_rng(seed)
+
+    # 随机投影得到列空间的近似基，每次乘法后重新正交化以保持数值稳定
+    basis, _ = np.linalg.qr(matrix @ rng.standard_normal((n_columns, n_samples)))
+    for _ in range(n_iter):
+        basis, _ = np.linalg.qr(matrix.T @ basis)
+        basis, _ = np.linalg.qr(matrix @ basis)
+
+    # 在小矩阵 basis.T @ matrix 上做精确SVD
+    small = np.asarray((matrix.T @ basis).T)
+    u, s, vt = np.linalg.svd(small, full_matrices=False)
+    return (basis @ u)[:, :rank], s[:rank], vt[:rank]
+
+
+class SVDProjection:
+    """截断SVD投影：把评分行投影到rank维的稠密空间
+
+    行向量乘以右奇异向量（A·V，即U·Σ）作为嵌入，训练时的行与训练后新增或修改的行
+    使用同一个投影（fold-in），不需要重新分解。训练后新增的电影列没有对应分量，投影时忽略。
+    """
+
+    def __init__(self, components: np.ndarray, singular_values: np.ndarray):
+        """
+        Args:
+            components: 右奇异向量，n_columns × rank
+            singular_values: 奇异值
+        """
+        self.components = components
+        self.singular_values = singular_values
+
+    @property
+    def rank(self) -> int:
+        return self.components.shape[1]
+
+    @classmethod
+    def fit(cls, matrix: Matrix, rank: int, seed: int = 0) -> 'SVDProjection':
+        """对矩阵做随机化截断SVD，得到float32的投影"""
+        if issparse(matrix):
+            matrix = csr_matrix(matrix, dtype=np.float64)
+        else:
+            matrix = np.asarray(matrix, dtype=np.float64)
+        _, s, vt = randomized_svd(matrix, rank, seed=seed)
+        return cls(np.ascontiguousarray(vt.T, dtype=np.float32), s.astype(np.float32))
+
+    def transform(self, rows: Matrix) -> np.ndarray:
+        """把评分行投影为float32嵌入（rows × rank）"""
+        n_columns = self.components.shape[0]
+        if rows.shape[1] > n_columns:
+            rows = rows[:, :n_columns]
+        embeddings = rows @ self.components[:rows.shape[1]]
+        return np.asarray(embeddings, dtype=np.float32)
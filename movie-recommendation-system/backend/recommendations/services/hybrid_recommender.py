@@ -0,0 +1,193 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional
+from django.conf import settings
+from django.db import connections
+
+from users.models import UserRating
+from recommendations.services.knn_recommender import KNNRecommender
+from recommendations.services.model_registry import model_registry
+from recommendations.services.popularity import PopularityRecommender
+from recommendations.services.training_jobs import enqueue_training
+
+logger = logging.getLogger(__name__)
+
+# 进程内共享的候选来源线程池，超时的来源在后台继续运行直到结束
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'RECOMMENDATION_HYBRID_WORKERS', 8),
+    thread_name_prefix='hybrid-source'
+)
+
+# 每个来源同时在线程池中排队或运行的任务数上限，持续超时的来源不会占满线程池
+_SOURCE_LIMIT = getattr(settings, 'RECOMMENDATION_HYBRID_SOURCE_LIMIT', 2)
+_source_slots = {
+    name: threading.BoundedSemaphore(_SOURCE_LIMIT)
+    for name in ('collaborative', 'content', 'popularity')
+}
+
+
+class HybridRecommender:
+    """混合推荐器
+
+    协同过滤、内容、热门三个候选来源在线程池中并发运行，每个来源有各自的超时，
+    整体受延迟预算限制：超时或出错的来源直接跳过，用已返回的来源融合结果。
+    协同过滤来源只使用已就绪的模型，模型尚未训练好时提交训练任务并跳过，不会在请求中训练；
+    每个来源未完成的任务数有上限，达到上限时该来源直接跳过，尚未开始的超时任务会被取消。
+    各来源的分数先按最小-最大归一化到0-1，再按RecommendationConfig.parameters中的
+    weights加权求和（只计入已返回来源的权重）。
+    """
+
+    algorithm = 'hybrid'
+
+    DEFAULT_WEIGHTS = {'collaborative': 0.6, 'content': 0.3, 'popularity': 0.1}
+
+    def __init__(self, parameters: Optional[Dict] = None):
+        """
+        初始化混合推荐器
+
+        Args:
+            parameters: 推荐配置参数，支持 weights（各来源权重）、timeout（整体延迟预算，秒）、
+                source_timeouts（各来源超时，秒）、collaborative_algorithm（协同过滤算法）、
+                k_neighbors、min_similarity、n_recommendations
+        """
+        parameters = parameters or {}
+        self.weights = {**self.DEFAULT_WEIGHTS, **parameters.get('weights', {})}
+        self.timeout = parameters.get('timeout', getattr(settings, 'RECOMMENDATION_HYBRID_TIMEOUT', 2.0))
+        self.source_timeouts = parameters.get('source_timeouts', {})
+        self.collaborative_algorithm = parameters.get('collaborative_algorithm', KNNRecommender.algorithm)
+        self.k_neighbors = parameters.get('k_neighbors', 20)
+        self.min_similarity = parameters.get('min_similarity', 0.1)
+        self.n_recommendations = parameters.get('n_recommendations', 10)
+        # 本次推荐中超时或出错的来源
+        self.skipped_sources = []
+
+    def recommend_for_user(self, user_id: int, n_recommendations: Optional[int] = None) -> List[Dict]:
+        """并发获取各来源的候选并融合，在延迟预算内返回"""
+        # 延迟预算从进入方法时开始计算，所有来源的工作（包括获取模型）都在预算内
+        deadline = time.monotonic() + self.timeout
+        n_recommendations = n_recommendations or self.n_recommendations
+        # 每个来源多取一些候选，融合后的排序更稳定
+        n_candidates = n_recommendations * 3
+        self.skipped_sources = []
+
+        sources = {
+            'collaborative': self._collaborative_candidates,
+            'content': self._content_candidates,
+            'popularity': self._popularity_candidates,
+        }
+
+        futures = {}
+        for name, source in sources.items():
+            if self.weights.get(name, 0) <= 0:
+                continue
+            slot = _source_slots[name]
+            if not slot.acquire(blocking=False):
+                logger.warning(f'混合推荐来源{name}未完成的任务已达{_SOURCE_LIMIT}个，已跳过')
+                self.skipped_sources.append(name)
+                continue
+            future = _executor.submit(self._run_source, source, user_id, n_candidates)
+            # 任务完成或被取消时归还名额
+            future.add_done_callback(lambda _, slot=slot: slot.release())
+            futures[name] = future
+
+        results = {}
+        for name, future in futures.items():
+            remaining = max(0.0, deadline - time.monotonic())
+            timeout = min(remaining, self.source_timeouts.get(name, remaining))
+            try:
+                candidates = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                # 尚未开始运行的任务直接取消，已在运行的任务结束后归还名额
+                future.cancel()
+                logger.warning(f'混合推荐来源{name}超时（{timeout:.2f}秒），已跳过')
+                self.skipped_sources.append(name)
+            except Exception as e:
+                logger.error(f'混合推荐来源{name}失败: {e}')
+                self.skipped_sources.append(name)
+            else:
+                # 返回None表示该来源尚不可用（如协同过滤模型还没有训练好）
+                if candidates is None:
+                    self.skipped_sources.append(name)
+                else:
+                    results[name] = candidates
+
+        return self._blend(user_id, results, n_recommendations)
+
+    @staticmethod
+    def _run_source(source: Callable, user_id: int, n_candidates: int) -> List[Dict]:
+        """在工作线程中运行候选来源，结束后关闭该线程的数据库连接"""
+        try:
+            return source(user_id, n_candidates)
+        finally:
+            connections.close_all()
+
+    def _collaborative_candidates(self, user_id: int, n_candidates: int) -> Optional[List[Dict]]:
+        """
+        协同过滤候选：只使用已就绪的模型（缓存的模型或模型文件），不在请求中训练或等待训练
+
+        没有可用的模型时提交训练任务（由训练工作进程执行）并返回None，本次跳过该来源。
+        """
+        recommender = model_registry.get_ready_model(
+            k_neighbors=self.k_neighbors,
+            min_similarity=self.min_similarity,
+            algorithm=self.collaborative_algorithm
+        )
+        if recommender is None:
+            job, created = enqueue_training(
+                algorithm=self.collaborative_algorithm,
+                parameters={'k_neighbors': self.k_neighbors, 'min_similarity': self.min_similarity}
+            )
+            logger.warning(
+                f'混合推荐的协同过滤模型尚未就绪，已跳过（训练任务#{job.id}{"已提交" if created else "排队中"}）'
+            )
+            return None
+        return recommender.recommend_for_user(user_id, n_candidates)
+
+    def _content_candidates(self, user_id: int, n_candidates: int) -> List[Dict]:
+        """内容候选：与用户最近评价较高的几部电影内容相似的电影，取最高的相似度"""
+        recent = (
+            UserRating.objects.filter(user_id=user_id, rating__gte=3.5)
+            .order_by('-created_at')
+            .values_list('movie_id', flat=True)[:5]
+        )
+        recommender = KNNRecommender(k_neighbors=self.k_neighbors, min_similarity=self.min_similarity)
+
+        scores = {}
+        for movie_id in recent:
+            for rec in recommender.recommend_based_on_movie(movie_id, n_candidates):
+                scores[rec['movie_id']] = max(scores.get(rec['movie_id'], 0.0), rec['score'])
+        return [{'movie_id': movie_id, 'score': score} for movie_id, score in scores.items()]
+
+    def _popularity_candidates(self, user_id: int, n_candidates: int) -> List[Dict]:
+        """热门候选：预计算热门榜单中用户未评分的电影"""
+        return PopularityRecommender().recommend_for_user(user_id, n_candidates)
+
+    def _blend(self, user_id: int, results: Dict[str, List[Dict]], n_recommendations: int) -> List[Dict]:
+        """各来源分数最小-最大归一化后加权求和，排除用户已评分的电影"""
+        rated = set(UserRating.objects.filter(user_id=user_id).values_list('movie_id', flat=True))
+
+        blended = {}
+        total_weight = sum(self.weights[name] for name, candidates in results.items() if candidates)
+        for name, candidates in results.items():
+            if not candidates:
+                continue
+            scores = [candidate['score'] for candidate in candidates]
+            low, high = min(scores), max(scores)
+            weight = self.weights[name] / total_weight
+            for candidate in candidates:
+                normalized = (candidate['score'] - low) / (high - low) if high > low else 1.0
+                movie_id = candidate['movie_id']
+                if movie_id not in rated:
+                    blended[movie_id] = blended.get(movie_id, 0.0) + weight * normalized
+
+        ranked = sorted(blended.items(), key=lambda item: (-item[1], item[0]))[:n_recommendations]
+        return [
+            {'movie_id': movie_id, 'score': float(score), 'algorithm': self.algorithm}
+            for movie_id, score in ranked
+        ]
+
+    def save_recommendations(self, user_id: int, recommendations: List[Dict]) -> int:
+        """保存推荐结果到数据库（替换该算法的旧推荐），返回写入的条数"""
+        return KNNRecommender().save_recommendations(user_id, recommendations, algorithm=self.algorithm)
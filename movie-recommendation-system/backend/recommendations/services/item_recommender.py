@@ -0,0 +1,124 @@
+import numpy as np
+import logging
+from typing import Optional, Tuple
+from scipy.sparse import csr_matrix
+
+from recommendations.services.knn_recommender import KNNRecommender, ProgressCallback
+from recommendations.services.similarity import cosine_topk
+
+logger = logging.getLogger(__name__)
+
+
+class ItemKNNRecommender(KNNRecommender):
+    """基于物品的KNN协同过滤推荐器
+
+    训练时为每部电影预先计算最相似的K部电影（分块余弦相似度内核），
+    以紧凑数组保存；推荐时只需在用户评分过的电影的邻居表上做稀疏查找，
+    成本与用户数量无关。
+    """
+
+    algorithm = 'item_knn_collaborative_filtering'
+
+    ARTIFACT_ARRAYS = KNNRecommender.ARTIFACT_ARRAYS + ('item_neighbor_indices', 'item_neighbor_similarities')
+
+    def __init__(self, k_neighbors: int = 20, min_similarity: float = 0.1,
+                 memory_budget_mb: Optional[int] = None, reduction_rank: Optional[int] = None):
+        """
+        初始化物品KNN推荐器
+
+        Args:
+            k_neighbors: 每部电影保留的相似电影数量
+            min_similarity: 最小相似度阈值
+            memory_budget_mb: 相似度计算的内存预算（MB），默认取配置
+            reduction_rank: 降维后的嵌入维数，默认取配置，大于0时电影相似度在低维嵌入上计算
+        """
+        # 物品模型不使用用户邻居图，用户邻居查询按需实时计算
+        super().__init__(
+            k_neighbors=k_neighbors,
+            min_similarity=min_similarity,
+            precompute_neighbors=False,
+            memory_budget_mb=memory_budget_mb,
+            reduction_rank=reduction_rank
+        )
+        self.item_neighbor_indices = None
+        self.item_neighbor_similarities = None
+
+    def fit(self, progress_callback: ProgressCallback = None) -> bool:
+        """训练模型：构建评分矩阵后预计算电影邻居表"""
+        if not super().fit(progress_callback):
+            return False
+
+        try:
+            self._report_progress(progress_callback, 'neighbor_index')
+            self.item_neighbor_indices, self.item_neighbor_similarities = \
+                self._build_item_neighbors(self.rating_matrix)
+            logger.info(f'物品邻居表构建完成，电影数: {len(self.movie_ids)}，K: {self.k_neighbors}')
+            return True
+
+        except Exception as e:
+            logger.error(f'物品邻居表构建失败: {e}')
+            return False
+
+    def _build_item_neighbors(self, rating_matrix: csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        计算电影之间的余弦相似度，只保留每部电影的前K个邻居
+
+        Returns:
+            (n_movies×K 邻居下标数组, n_movies×K 相似度数组)，不足K个时下标为-1、相似度为0
+        """
+        # 电影×用户矩阵，行内积即为电影之间的相似度；启用降维时改用低维的电影嵌入
+        item_vectors = self.item_embeddings if self.item_embeddings is not None else rating_matrix.T.tocsr()
+        indptr, indices, similarities = cosine_topk(
+            item_vectors,
+            k=self.k_neighbors,
+            min_similarity=self.min_similarity,
+            exclude_self=True,
+            memory_budget_mb=self.memory_budget_mb
+        )
+
+        # 展开为定长数组，便于按已评分电影批量取邻居
+        n_movies = rating_matrix.shape[1]
+        counts = np.diff(indptr)
+        rows = np.repeat(np.arange(n_movies), counts)
+        columns = np.arange(len(indices)) - np.repeat(indptr[:-1], counts)
+
+        neighbor_indices = np.full((n_movies, self.k_neighbors), -1, dtype=np.int32)
+        neighbor_similarities = np.zeros((n_movies, self.k_neighbors), dtype=np.float32)
+        neighbor_indices[rows, columns] = indices
+        neighbor_similarities[rows, columns] = similarities
+
+        return neighbor_indices, neighbor_similarities
+
+    def _score_user_by_index(self, user_idx: int, movie_indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        根据用户评分过的电影及其邻居表预测评分
+
+        只有与候选电影相似的已评分电影参与加权平均，结果限制在0.5-5.0之间，
+        无法预测的电影得分为0。训练后新增的评分（增量更新）同样参与计算。
+        """
+        n_movies = self.shape[1]
+
+        rated, ratings = self._user_row(user_idx)
+        ratings = ratings.astype(np.float64)
+
+        # 训练后新增的电影没有邻居表
+        in_table = rated < self.item_neighbor_indices.shape[0]
+        rated, ratings = rated[in_table], ratings[in_table]
+
+        neighbors = self.item_neighbor_indices[rated]
+        similarities = self.item_neighbor_similarities[rated].astype(np.float64)
+        valid = neighbors >= 0
+
+        targets = neighbors[valid]
+        weighted_sum = np.bincount(
+            targets, weights=(similarities * ratings[:, None])[valid], minlength=n_movies
+        )
+        similarity_sum = np.bincount(targets, weights=similarities[valid], minlength=n_movies)
+
+        predictions = np.zeros(n_movies)
+        predictable = similarity_sum > 0
+        predictions[predictable] = np.clip(weighted_sum[predictable] / similarity_sum[predictable], 0.5, 5.0)
+
+        if movie_indices is not None:
+            return predictions[movie_indices]
+        return predictions
@@ -1,310 +1,989 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
 import numpy as np
-import pandas as pd
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional
 from collections import defaultdict
-from sklearn.neighbors import NearestNeighbors
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
+from datetime import datetime, timedelta, timezone
+from scipy.sparse import csr_matrix
 import logging
-from django.db.models import Avg, Count
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Q
 
 from movies.models import Movie, Genre
 from users.models import CustomUser, UserRating
 from recommendations.models import Recommendation
+from recommendations.services.rating_matrix import build_sparse_rating_matrix, IdIndex, RatingOverlay
+from recommendations.services.similarity import cosine_topk
+from recommendations.services.content_features import content_feature_store
+from recommendations.services.ann_index import VectorIndex, create_index
+from recommendations.services.embeddings import SVDProjection
 
 logger = logging.getLogger(__name__)
 
+# 训练进度回调，参数为阶段名（loading、matrix_build、neighbor_index、export）
+ProgressCallback = Optional[Callable[[str], None]]
+
+# 上一次生成的模型版本时间（UTC微秒数），保证进程内版本号严格递增
+_version_lock = threading.Lock()
+_last_version_ticks = 0
+
+
+def _new_version(trained_at: datetime) -> str:
+    """
+    生成模型版本号：UTC时间（到秒）加6位秒内微秒数，如20260101120000-000123
+
+    版本号长度固定，按字符串排序即按训练先后排序，与主机时区无关；
+    同一微秒内或时钟回拨时顺延一微秒，同一秒内训练的多个版本也不会乱序。
+    """
+    global _last_version_ticks
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    with _version_lock:
+        ticks = max((trained_at - epoch) // timedelta(microseconds=1), _last_version_ticks + 1)
+        _last_version_ticks = ticks
+    seconds, micros = divmod(ticks, 1_000_000)
+    return f'{epoch + timedelta(seconds=seconds):%Y%m%d%H%M%S}-{micros:06d}'
+
 
 class KNNRecommender:
     """KNN协同过滤推荐器"""
     
-    def __init__(self, k_neighbors: int = 20, min_similarity: float = 0.1):
+    algorithm = 'knn_collaborative_filtering'
+    
+    # 导出模型文件时保存的数组属性（评分矩阵另存为CSR的三个数组）
+    ARTIFACT_ARRAYS = (
+        'user_ids', 'movie_ids', 'user_norms', 'movie_popularity',
+        'neighbor_indptr', 'neighbor_indices', 'neighbor_similarities',
+        'svd_components', 'svd_singular_values', 'user_embeddings', 'item_embeddings',
+    )
+    
+    # 近似最近邻查询取回的候选数为所需邻居数的倍数，候选再按原始评分精确计算相似度
+    ANN_CANDIDATE_FACTOR = 10
+    
+    def __init__(self, k_neighbors: int = 20, min_similarity: float = 0.1,
+                 precompute_neighbors: bool = True, memory_budget_mb: Optional[int] = None,
+                 ann_index: Optional[str] = None, ann_rank: Optional[int] = None,
+                 reduction_rank: Optional[int] = None):
         """
         初始化KNN推荐器
         
         Args:
             k_neighbors: K近邻数量
             min_similarity: 最小相似度阈值
+            precompute_neighbors: 训练时是否预计算每个用户的前K个邻居
+            memory_budget_mb: 相似度计算的内存预算（MB），默认取配置
+            ann_index: 实时邻居查询使用的近似最近邻索引类型（ivf/lsh），默认取配置，为空时精确扫描所有用户
+            ann_rank: 近似最近邻索引使用的截断SVD嵌入维数，默认取配置
+            reduction_rank: 降维后的嵌入维数，默认取配置，为0时邻居搜索在原始评分行上进行
         """
         self.k_neighbors = k_neighbors
         self.min_similarity = min_similarity
-        self.user_similarity_matrix = None
+        self.precompute_neighbors = precompute_neighbors
+        self.memory_budget_mb = memory_budget_mb
+        self.ann_index = ann_index if ann_index is not None else getattr(settings, 'RECOMMENDATION_ANN_INDEX', '')
+        self.ann_rank = ann_rank or getattr(settings, 'RECOMMENDATION_ANN_RANK', 64)
+        self.ann_refresh_rows = getattr(settings, 'RECOMMENDATION_ANN_REFRESH_ROWS', 256)
+        self.reduction_rank = (
+            reduction_rank if reduction_rank is not None
+            else getattr(settings, 'RECOMMENDATION_REDUCTION_RANK', 0)
+        )
+        # 模型版本与训练时间，训练时生成，随模型文件保存
+        self.version = None
+        self.trained_at = None
         self.user_ids = None
         self.movie_ids = None
+        self.user_index = IdIndex()
+        self.movie_index = IdIndex()
+        # 训练时的评分矩阵与行范数，训练后不再修改（加载时为多进程共享的内存映射）
         self.rating_matrix = None
-        self.knn_model = None
-        
-    def prepare_rating_matrix(self) -> Tuple[np.ndarray, List, List]:
-        """准备用户-电影评分矩阵"""
-        # 获取所有用户评分数据
-        ratings = UserRating.objects.select_related('user', 'movie').all()
-        
-        if not ratings:
-            logger.warning('没有找到用户评分数据')
-            return None, [], []
-        
-        # 转换为DataFrame
-        ratings_data = []
-        for rating in ratings:
-            ratings_data.append({
-                'user_id': rating.user.id,
-                'movie_id': rating.movie.id,
-                'rating': rating.rating
-            })
-        
-        df = pd.DataFrame(ratings_data)
+        self.user_norms = None
+        # 训练后增量更新的整行评分，读取时与评分矩阵合并
+        self._overlay = RatingOverlay((0, 0))
+        self.movie_popularity = None
+        # 用户前K近邻图（CSR形式的三个数组），第u个用户的邻居为indices[indptr[u]:indptr[u+1]]
+        self.neighbor_indptr = None
+        self.neighbor_indices = None
+        self.neighbor_similarities = None
+        # 截断SVD投影（右奇异向量与奇异值）与用户嵌入上的近似最近邻索引
+        self.svd_components = None
+        self.svd_singular_values = None
+        self.user_ann = None
+        # 降维后的用户嵌入（U·Σ）与电影嵌入（V·Σ），float32
+        self.user_embeddings = None
+        self.item_embeddings = None
+        # 增量更新后邻居列表已失效、需要实时计算的用户下标（集合用于单个查找，有序数组用于向量化查找）
+        self._stale_neighbor_rows = set()
+        self._stale_rows = np.empty(0, dtype=np.int64)
+        # 近似最近邻索引中嵌入已过期、尚未写回索引的用户下标（有序）
+        self._ann_pending = np.empty(0, dtype=np.int64)
+        self._update_lock = threading.Lock()
+    
+    def __getstate__(self) -> Dict:
+        """序列化时去掉不可pickle的更新锁"""
+        state = self.__dict__.copy()
+        state.pop('_update_lock', None)
+        return state
+    
+    def __setstate__(self, state: Dict):
+        """反序列化后重新创建更新锁"""
+        self.__dict__.update(state)
+        self._update_lock = threading.Lock()
+        
+    def prepare_rating_matrix(self, progress_callback: ProgressCallback = None) -> Tuple[csr_matrix, np.ndarray, np.ndarray]:
+        """准备稀疏的用户-电影评分矩阵（CSR格式，未评分为0）"""
+        return build_sparse_rating_matrix(progress_callback=progress_callback)
+    
+    def build_neighbor_graph(self, rating_matrix: csr_matrix, user_norms: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        分块计算用户余弦相似度，只保留每个用户不低于阈值的前K个邻居
         
-        # 创建用户-电影评分矩阵
-        rating_matrix = df.pivot_table(
-            index='user_id', 
-            columns='movie_id', 
-            values='rating', 
-            fill_value=0
-        )
+        内存占用由相似度内核的内存预算决定，而不是O(用户数²)的完整相似度矩阵。
         
-        # 获取用户ID和电影ID列表
-        user_ids = rating_matrix.index.tolist()
-        movie_ids = rating_matrix.columns.tolist()
+        Returns:
+            (indptr, indices, similarities)，每行邻居按相似度降序排列
+        """
+        # 启用降维时在稠密的低维嵌入上计算，宽度与电影数量无关
+        if self.user_embeddings is not None:
+            return cosine_topk(
+                self.user_embeddings,
+                k=self.k_neighbors,
+                min_similarity=self.min_similarity,
+                exclude_self=True,
+                memory_budget_mb=self.memory_budget_mb
+            )
         
-        return rating_matrix.values, user_ids, movie_ids
+        # 利用缓存的行范数归一化，避免内核重复计算
+        inverse_norms = np.divide(1.0, user_norms, out=np.zeros_like(user_norms), where=user_norms > 0)
+        normalized = csr_matrix(rating_matrix.multiply(inverse_norms[:, None]), dtype=np.float64)
+        
+        return cosine_topk(
+            normalized,
+            k=self.k_neighbors,
+            min_similarity=self.min_similarity,
+            exclude_self=True,
+            memory_budget_mb=self.memory_budget_mb,
+            normalized=True
+        )
     
-    def calculate_user_similarity(self, rating_matrix: np.ndarray) -> np.ndarray:
-        """计算用户相似度矩阵"""
-        # 使用余弦相似度计算用户相似度
-        similarity_matrix = cosine_similarity(rating_matrix)
-        
-        # 将对角线设置为0（自己与自己的相似度）
-        np.fill_diagonal(similarity_matrix, 0)
+    def fit(self, progress_callback: ProgressCallback = None) -> bool:
+        """
+        训练KNN模型
         
-        return similarity_matrix
-    
-    def fit(self) -> bool:
-        """训练KNN模型"""
+        Args:
+            progress_callback: 进入每个训练阶段时以阶段名调用
+        """
         try:
             # 准备评分矩阵
-            rating_matrix, user_ids, movie_ids = self.prepare_rating_matrix()
+            self._report_progress(progress_callback, 'loading')
+            rating_matrix, user_ids, movie_ids = self.prepare_rating_matrix(progress_callback)
             
             if rating_matrix is None:
                 return False
             
             self.rating_matrix = rating_matrix
+            self._overlay = RatingOverlay(rating_matrix.shape)
             self.user_ids = user_ids
             self.movie_ids = movie_ids
             
-            # 计算用户相似度矩阵
-            self.user_similarity_matrix = self.calculate_user_similarity(rating_matrix)
+            # 建立ID到矩阵下标的映射（有序ID上二分查找），避免热路径上的线性查找
+            self.user_index = IdIndex(user_ids)
+            self.movie_index = IdIndex(movie_ids)
             
-            # 训练KNN模型
-            self.knn_model = NearestNeighbors(
-                n_neighbors=min(self.k_neighbors, len(user_ids) - 1),
-                metric='cosine',
-                algorithm='brute'
-            )
-            self.knn_model.fit(rating_matrix)
+            # 按矩阵列顺序缓存电影流行度，用于推荐排序时的并列决胜
+            self.movie_popularity = self._load_movie_popularity(movie_ids)
+            
+            # 缓存每个用户评分向量的L2范数，用于余弦相似度计算
+            self.user_norms = self._row_norms(rating_matrix)
+            
+            # 可选的降维阶段：随机化截断SVD把用户和电影投影到低维稠密空间
+            self.svd_components = self.svd_singular_values = self.user_ann = None
+            self.user_embeddings = self.item_embeddings = None
+            if self.reduction_rank:
+                self._report_progress(progress_callback, 'reduction')
+                self.reduce_dimensions()
+            
+            # 预计算用户前K近邻图
+            if self.precompute_neighbors:
+                self._report_progress(progress_callback, 'neighbor_index')
+                self.neighbor_indptr, self.neighbor_indices, self.neighbor_similarities = \
+                    self.build_neighbor_graph(rating_matrix, self.user_norms)
+            self._stale_neighbor_rows = set()
+            self._stale_rows = np.empty(0, dtype=np.int64)
+            
+            # 构建实时邻居查询使用的近似最近邻索引
+            if self.ann_index:
+                self._report_progress(progress_callback, 'ann_index')
+                self.build_ann_index()
+            
+            self.trained_at = datetime.now(timezone.utc)
+            self.version = _new_version(self.trained_at)
             
-            logger.info(f'KNN模型训练完成，用户数: {len(user_ids)}，电影数: {len(movie_ids)}')
+            logger.info(f'KNN模型训练完成，版本: {self.version}，用户数: {len(user_ids)}，电影数: {len(movie_ids)}')
             return True
             
         except Exception as e:
             logger.error(f'KNN模型训练失败: {e}')
             return False
     
+    def reduce_dimensions(self):
+        """
+        随机化截断SVD降维：用户嵌入为评分行在右奇异向量上的投影（U·Σ），电影嵌入为V·Σ
+        
+        训练后新加入或评分有变化的用户按同一投影实时计算嵌入（fold-in），无需重新分解。
+        """
+        projection = SVDProjection.fit(self.rating_matrix, self.reduction_rank)
+        self.svd_components, self.svd_singular_values = projection.components, projection.singular_values
+        self.user_embeddings = projection.transform(self.rating_matrix)
+        self.item_embeddings = np.ascontiguousarray(projection.components * projection.singular_values)
+        logger.info(f'评分矩阵降维完成，嵌入维数: {projection.rank}')
+    
+    def _user_embeddings_for(self, user_indices: np.ndarray) -> np.ndarray:
+        """
+        获取用户的降维嵌入
+        
+        训练后新加入或评分有变化的用户按当前评分实时投影（fold-in），其余用户直接取训练时的嵌入。
+        """
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        embeddings = self.user_embeddings
+        stale = user_indices >= len(embeddings)
+        stale_rows = self._stale_rows
+        if len(stale_rows):
+            stale |= np.isin(user_indices, stale_rows)
+        
+        result = embeddings[np.where(stale, 0, user_indices)]
+        if stale.any():
+            result = np.array(result)
+            result[stale] = self._project(self._rows(user_indices[stale]))
+        return result
+    
+    def build_ann_index(self, index: Optional[VectorIndex] = None):
+        """
+        把用户评分行投影到截断SVD嵌入空间并构建近似最近邻索引
+        
+        Args:
+            index: 未构建的索引，默认按ann_index配置创建
+        """
+        rating_matrix = self.current_rating_matrix()
+        if self.svd_components is None:
+            projection = SVDProjection.fit(rating_matrix, self.ann_rank)
+            self.svd_components, self.svd_singular_values = projection.components, projection.singular_values
+        
+        index = index or create_index(self.ann_index)
+        vectors = self.user_embeddings if self.user_embeddings is not None else self._project(rating_matrix)
+        self.user_ann = index.build(vectors)
+        self._ann_pending = np.empty(0, dtype=np.int64)
+        logger.info(f'用户近似最近邻索引构建完成，类型: {index.kind}，嵌入维数: {self.svd_components.shape[1]}')
+    
+    def _project(self, rows: csr_matrix) -> np.ndarray:
+        """把评分行投影到截断SVD嵌入空间（fold-in，无需重新分解）"""
+        return SVDProjection(self.svd_components, self.svd_singular_values).transform(rows)
+    
+    def warm_start(self, previous: 'KNNRecommender'):
+        """用上一次训练的模型初始化下一次训练，KNN模型没有可复用的训练状态"""
+    
+    @staticmethod
+    def _report_progress(progress_callback: ProgressCallback, stage: str):
+        """报告训练阶段，回调出错不影响训练"""
+        if progress_callback is None:
+            return
+        try:
+            progress_callback(stage)
+        except Exception as e:
+            logger.warning(f'训练进度回调失败: {e}')
+    
+    @property
+    def is_fitted(self) -> bool:
+        """模型是否已训练"""
+        return self.rating_matrix is not None
+    
+    @property
+    def shape(self) -> Tuple[int, int]:
+        """合并增量更新后的评分矩阵形状（包含训练后新增的用户和电影）"""
+        return self._overlay.shape
+    
+    def current_rating_matrix(self) -> csr_matrix:
+        """合并增量更新后的完整评分矩阵（复制整个矩阵，只用于导出等离线场景）"""
+        return self._overlay.merged(self.rating_matrix)
+    
+    def current_user_norms(self) -> np.ndarray:
+        """合并增量更新后所有用户评分向量的L2范数"""
+        return self._overlay.norms_for(self.user_norms, np.arange(self.shape[0]))
+    
+    def _user_row(self, user_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """用户当前的评分行：(列下标数组（升序）, 评分数组)"""
+        return self._overlay.row(self.rating_matrix, user_idx)
+    
+    def _rows(self, user_indices) -> csr_matrix:
+        """取出若干用户当前的评分行（CSR，宽度为合并后的电影数），只复制选中的行"""
+        return self._overlay.select_rows(self.rating_matrix, user_indices)
+    
+    def export(self, directory: str, metadata: Optional[Dict] = None):
+        """
+        将训练好的模型导出为模型文件目录（每个数组一个.npy文件，清单写入manifest.json）
+        
+        先写入同级临时目录再重命名，读取方不会看到写了一半的文件。
+        已加载旧文件的进程仍持有原内存映射，不受替换影响。
+        
+        Args:
+            directory: 模型文件目录
+            metadata: 额外写入清单的信息（如推荐配置参数、训练时的数据快照）
+        """
+        if not self.is_fitted:
+            raise ValueError('模型尚未训练')
+        
+        with self._update_lock:
+            # 增量更新的行补丁在导出时合并进评分矩阵
+            rating_matrix = self.current_rating_matrix()
+            arrays = {
+                'rating_data': rating_matrix.data,
+                'rating_indices': rating_matrix.indices,
+                'rating_indptr': rating_matrix.indptr,
+            }
+            for name in self.ARTIFACT_ARRAYS:
+                if getattr(self, name) is not None:
+                    arrays[name] = getattr(self, name)
+            arrays['user_norms'] = self.current_user_norms()
+            # 增量更新过的用户邻居列表已过期，加载后仍需实时计算
+            stale_rows = sorted(self._stale_neighbor_rows)
+            user_ann = self.user_ann
+        
+        manifest = {
+            'version': self.version,
+            'trained_at': self.trained_at.isoformat() if self.trained_at else None,
+            'algorithm': self.algorithm,
+            'k_neighbors': self.k_neighbors,
+            'min_similarity': self.min_similarity,
+            'shape': list(rating_matrix.shape),
+            'n_users': int(rating_matrix.shape[0]),
+            'n_movies': int(rating_matrix.shape[1]),
+            'n_ratings': int(rating_matrix.nnz),
+            'stale_neighbor_rows': stale_rows,
+            'ann_index': user_ann.kind if user_ann is not None else '',
+            'reduction_rank': self.reduction_rank if self.user_embeddings is not None else 0,
+            **(metadata or {}),
+        }
+        
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=parent)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(staging, f'{name}.npy'), np.ascontiguousarray(array))
+            if user_ann is not None:
+                user_ann.save(os.path.join(staging, 'user_ann'))
+            with open(os.path.join(staging, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            
+            if os.path.exists(directory):
+                retired = tempfile.mkdtemp(prefix='.retired-', dir=parent)
+                os.replace(directory, os.path.join(retired, 'model'))
+                os.replace(staging, directory)
+                shutil.rmtree(retired, ignore_errors=True)
+            else:
+                os.replace(staging, directory)
+        except Exception:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        
+        logger.info(f'模型已导出: {directory}')
+    
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = 'r') -> 'KNNRecommender':
+        """
+        从模型文件目录加载模型，无需访问数据库
+        
+        默认以只读内存映射方式加载，同一台机器上的所有工作进程共享一份页缓存。
+        增量更新写入行补丁，不会修改或复制映射的数组。
+        
+        Args:
+            directory: 模型文件目录
+            mmap_mode: 传给np.load的内存映射模式，为None时完整读入内存
+            
+        Returns:
+            训练好的推荐器，清单内容保存在manifest属性中
+        """
+        with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        
+        if manifest['algorithm'] != cls.algorithm:
+            raise ValueError(f'模型文件算法不匹配: {manifest["algorithm"]}')
+        
+        def load_array(name: str) -> Optional[np.ndarray]:
+            path = os.path.join(directory, f'{name}.npy')
+            return np.load(path, mmap_mode=mmap_mode) if os.path.exists(path) else None
+        
+        recommender = cls(k_neighbors=manifest['k_neighbors'], min_similarity=manifest['min_similarity'])
+        for name in cls.ARTIFACT_ARRAYS:
+            setattr(recommender, name, load_array(name))
+        
+        recommender.rating_matrix = csr_matrix(
+            (load_array('rating_data'), load_array('rating_indices'), load_array('rating_indptr')),
+            shape=tuple(manifest['shape']),
+            copy=False
+        )
+        recommender._overlay = RatingOverlay(recommender.rating_matrix.shape)
+        recommender.user_index = IdIndex(recommender.user_ids)
+        recommender.movie_index = IdIndex(recommender.movie_ids)
+        recommender._stale_neighbor_rows = set(manifest.get('stale_neighbor_rows', []))
+        recommender._stale_rows = np.array(sorted(recommender._stale_neighbor_rows), dtype=np.int64)
+        # 导出时索引中这些用户的嵌入可能尚未更新，加载后仍作为候选
+        recommender._ann_pending = recommender._stale_rows
+        recommender.ann_index = manifest.get('ann_index', '')
+        recommender.reduction_rank = manifest.get('reduction_rank', 0)
+        if os.path.isdir(os.path.join(directory, 'user_ann')):
+            recommender.user_ann = VectorIndex.load(os.path.join(directory, 'user_ann'), mmap_mode=mmap_mode)
+        recommender.version = manifest['version']
+        recommender.trained_at = datetime.fromisoformat(manifest['trained_at']) if manifest['trained_at'] else None
+        recommender.manifest = manifest
+        
+        return recommender
+    
+    @staticmethod
+    def _row_norms(matrix: csr_matrix) -> np.ndarray:
+        """计算稀疏矩阵每一行的L2范数"""
+        squared = matrix.multiply(matrix).sum(axis=1)
+        return np.sqrt(np.asarray(squared, dtype=np.float64).ravel())
+    
+    def _load_movie_popularity(self, movie_ids: np.ndarray) -> np.ndarray:
+        """按列顺序加载电影流行度，已不在电影表中的电影记为-inf"""
+        popularity = np.full(len(movie_ids), -np.inf)
+        for movie_id, value in Movie.objects.values_list('id', 'popularity').order_by():
+            movie_idx = self.movie_index.get(movie_id)
+            if movie_idx is not None:
+                popularity[movie_idx] = value or 0.0
+        return popularity
+    
+    def update_rating(self, user_id: int, movie_id: int, rating: float):
+        """
+        增量更新一条评分（新增或修改），无需重新训练
+        
+        新用户/新电影会追加到矩阵末尾并扩展ID映射。
+        """
+        self._set_rating(user_id, movie_id, float(rating))
+    
+    def remove_rating(self, user_id: int, movie_id: int):
+        """增量删除一条评分，无需重新训练"""
+        self._set_rating(user_id, movie_id, None)
+    
+    def _set_rating(self, user_id: int, movie_id: int, rating: Optional[float]):
+        """
+        修改单个用户的一条评分，rating为None表示删除
+        
+        只把该用户修改后的整行写入行补丁，评分矩阵的数组保持不变（内存映射继续共享），
+        成本与该用户的评分数量和已修改的用户数有关，与评分总数无关。
+        按行列下标访问的数组先于补丁扩展，ID映射在补丁替换之后才加入新下标，
+        保证读取方查到的下标总在矩阵范围内。
+        """
+        if not self.is_fitted:
+            return
+        
+        with self._update_lock:
+            user_idx = self.user_index.get(user_id)
+            movie_idx = self.movie_index.get(movie_id)
+            
+            if rating is None and (user_idx is None or movie_idx is None):
+                return
+            
+            n_users, n_movies = self.shape
+            
+            if movie_idx is None:
+                movie_idx = n_movies
+                n_movies += 1
+                popularity = Movie.objects.filter(id=movie_id).values_list('popularity', flat=True).first()
+                self.movie_popularity = np.append(
+                    self.movie_popularity, -np.inf if popularity is None else popularity
+                )
+                self.movie_ids = np.append(self.movie_ids, movie_id)
+            
+            if user_idx is None:
+                user_idx = n_users
+                n_users += 1
+                self.user_ids = np.append(self.user_ids, user_id)
+            
+            # 在用户所在行中替换/插入/删除该电影的评分
+            row_indices, row_data = self._user_row(user_idx)
+            keep = row_indices != movie_idx
+            row_indices, row_data = row_indices[keep], row_data[keep]
+            if rating is not None:
+                position = np.searchsorted(row_indices, movie_idx)
+                row_indices = np.insert(row_indices, position, movie_idx)
+                row_data = np.insert(row_data, position, rating)
+            
+            self._overlay = self._overlay.with_rows({user_idx: (row_indices, row_data)}, (n_users, n_movies))
+            
+            # 该用户的邻居列表已过期，在下次完整训练前改为实时计算
+            self._mark_stale([user_idx])
+            
+            self.user_index.setdefault(user_id, user_idx)
+            self.movie_index.setdefault(movie_id, movie_idx)
+    
+    def set_user_ratings(self, ratings_by_user: Dict[int, Dict[int, float]]):
+        """
+        批量替换用户的整行评分（新增、修改、删除一并完成），补丁层只重建一次
+        
+        适合批处理前把一批用户的评分同步为数据库中的最新值。
+        
+        Args:
+            ratings_by_user: {用户ID: {电影ID: 评分}}，空字典表示用户已没有评分
+        """
+        if not self.is_fitted or not ratings_by_user:
+            return
+        
+        with self._update_lock:
+            n_users, n_movies = self.shape
+            
+            new_user_ids = [user_id for user_id in ratings_by_user if self.user_index.get(user_id) is None]
+            new_movie_ids = sorted({
+                movie_id
+                for ratings in ratings_by_user.values()
+                for movie_id in ratings
+                if self.movie_index.get(movie_id) is None
+            })
+            new_users = {user_id: n_users + offset for offset, user_id in enumerate(new_user_ids)}
+            new_movies = {movie_id: n_movies + offset for offset, movie_id in enumerate(new_movie_ids)}
+            
+            if new_movie_ids:
+                popularity = dict(Movie.objects.filter(id__in=new_movie_ids).values_list('id', 'popularity'))
+                self.movie_popularity = np.append(self.movie_popularity, [
+                    -np.inf if popularity.get(movie_id) is None else popularity[movie_id]
+                    for movie_id in new_movie_ids
+                ])
+                self.movie_ids = np.append(self.movie_ids, new_movie_ids)
+            
+            if new_user_ids:
+                self.user_ids = np.append(self.user_ids, new_user_ids)
+            
+            rows = {}
+            for user_id, ratings in ratings_by_user.items():
+                user_idx = self.user_index.get(user_id)
+                if user_idx is None:
+                    user_idx = new_users[user_id]
+                columns = np.array([
+                    new_movies[movie_id] if self.movie_index.get(movie_id) is None else self.movie_index[movie_id]
+                    for movie_id in ratings
+                ], dtype=np.int32)
+                values = np.array(list(ratings.values()), dtype=np.float32)
+                order = np.argsort(columns)
+                rows[user_idx] = (columns[order], values[order])
+            
+            shape = (n_users + len(new_user_ids), n_movies + len(new_movie_ids))
+            self._overlay = self._overlay.with_rows(rows, shape)
+            
+            # 这些用户的邻居列表已过期，在下次完整训练前改为实时计算
+            self._mark_stale(list(rows))
+            
+            for user_id, user_idx in new_users.items():
+                self.user_index.setdefault(user_id, user_idx)
+            for movie_id, movie_idx in new_movies.items():
+                self.movie_index.setdefault(movie_id, movie_idx)
+    
+    def _mark_stale(self, user_indices: List[int]):
+        """
+        标记邻居列表已过期的用户（需持有_update_lock，复制后替换，读取方不会看到修改中的集合）
+        
+        有近似最近邻索引时，这些用户在索引中的嵌入也已过期，记入待写回索引的用户。
+        """
+        self._stale_neighbor_rows = self._stale_neighbor_rows | set(user_indices)
+        self._stale_rows = np.union1d(self._stale_rows, np.asarray(user_indices, dtype=np.int64))
+        if self.user_ann is not None:
+            self._ann_pending = np.union1d(self._ann_pending, np.asarray(user_indices, dtype=np.int64))
+    
+    def get_dependent_users(self, user_ids: List[int]) -> List[int]:
+        """
+        在邻居图中反查以这些用户为邻居的用户，这些用户的推荐依赖于给定用户的评分
+        
+        没有预计算邻居图（如物品模型）时返回空列表。
+        """
+        if not self.is_fitted or self.neighbor_indptr is None:
+            return []
+        
+        user_indices = [self.user_index.get(user_id) for user_id in user_ids]
+        user_indices = [user_idx for user_idx in user_indices if user_idx is not None]
+        if not user_indices:
+            return []
+        
+        positions = np.isin(self.neighbor_indices, user_indices).nonzero()[0]
+        rows = np.searchsorted(self.neighbor_indptr, positions, side='right') - 1
+        return [int(user_id) for user_id in np.unique(self.user_ids[rows])]
+    
     def get_user_neighbors(self, user_id: int, n_neighbors: Optional[int] = None) -> List[Tuple[int, float]]:
         """获取用户的K个最近邻"""
-        if self.knn_model is None or user_id not in self.user_ids:
+        user_idx = self.user_index.get(user_id)
+        if not self.is_fitted or user_idx is None:
             return []
         
-        # 获取用户索引
-        user_idx = self.user_ids.index(user_id)
+        neighbor_indices, similarities = self._neighbors_by_index(user_idx, n_neighbors)
         
-        # 获取最近邻
+        # 转换为(user_id, similarity)列表
+        return [
+            (int(self.user_ids[neighbor_idx]), float(similarity))
+            for neighbor_idx, similarity in zip(neighbor_indices, similarities)
+        ]
+    
+    def _neighbors_by_index(self, user_idx: int, n_neighbors: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """按矩阵下标获取最近邻，返回(邻居下标数组, 相似度数组)"""
         n_neighbors = n_neighbors or self.k_neighbors
-        distances, indices = self.knn_model.kneighbors(
-            self.rating_matrix[user_idx].reshape(1, -1),
-            n_neighbors=min(n_neighbors + 1, len(self.user_ids))
-        )
         
-        # 转换为(user_id, similarity)列表，排除自己
-        neighbors = []
-        for i in range(1, len(indices[0])):  # 跳过第一个（自己）
-            neighbor_idx = indices[0][i]
-            similarity = 1 - distances[0][i]  # 转换为相似度
-            if similarity >= self.min_similarity:
-                neighbor_id = self.user_ids[neighbor_idx]
-                neighbors.append((neighbor_id, similarity))
+        # 邻居图中有有效邻居列表时直接切片，O(K)
+        if (self.neighbor_indptr is not None and n_neighbors <= self.k_neighbors
+                and user_idx < len(self.neighbor_indptr) - 1
+                and user_idx not in self._stale_neighbor_rows):
+            start = self.neighbor_indptr[user_idx]
+            end = min(self.neighbor_indptr[user_idx + 1], start + n_neighbors)
+            return (
+                self.neighbor_indices[start:end].astype(np.int64),
+                self.neighbor_similarities[start:end].astype(np.float64)
+            )
+        
+        return self._compute_neighbors_by_index(user_idx, n_neighbors)
+    
+    def _compute_neighbors_by_index(self, user_idx: int, n_neighbors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        实时计算用户的前N个邻居
+        
+        有近似最近邻索引时只在索引给出的候选用户上计算相似度（亚线性），否则扫描所有用户；
+        启用降维时相似度在低维嵌入上计算。
+        """
+        overlay = self._overlay
+        n_users = overlay.shape[0]
+        n_neighbors = min(n_neighbors, n_users - 1)
+        
+        user_norm = overlay.norms_for(self.user_norms, [user_idx])[0]
+        if n_neighbors <= 0 or user_norm == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        
+        candidates = self._ann_candidates(user_idx, n_neighbors)
+        
+        if self.user_embeddings is not None:
+            # 在降维后的嵌入上计算余弦相似度
+            rows = np.arange(n_users) if candidates is None else candidates
+            vectors = self._user_embeddings_for(rows).astype(np.float64)
+            query = self._user_embeddings_for([user_idx])[0].astype(np.float64)
+            dots = vectors @ query
+            denominators = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+        else:
+            # 余弦相似度：一次稀疏矩阵-向量乘积除以缓存的行范数，有补丁的行用补丁计算
+            query = overlay.select_rows(self.rating_matrix, [user_idx])
+            if candidates is None:
+                dots = overlay.dot(self.rating_matrix, query)
+                user_norms = overlay.norms_for(self.user_norms, np.arange(n_users))
+            else:
+                rows = overlay.select_rows(self.rating_matrix, candidates)
+                dots = (rows @ query.T.astype(np.float64)).toarray().ravel()
+                user_norms = overlay.norms_for(self.user_norms, candidates)
+            denominators = user_norms * user_norm
+        similarities = np.divide(dots, denominators, out=np.zeros_like(dots), where=denominators > 0)
+        # 排除自己
+        if candidates is None:
+            similarities[user_idx] = -np.inf
+        else:
+            similarities[candidates == user_idx] = -np.inf
+        
+        n_neighbors = min(n_neighbors, len(similarities))
+        top = np.argpartition(-similarities, n_neighbors - 1)[:n_neighbors]
+        top = top[np.argsort(-similarities[top], kind='stable')]
+        
+        # 过滤低于阈值的邻居
+        keep = similarities[top] >= self.min_similarity
+        neighbors = top if candidates is None else candidates[top]
+        return neighbors[keep], similarities[top][keep]
+    
+    def _ann_candidates(self, user_idx: int, n_neighbors: int) -> Optional[np.ndarray]:
+        """
+        从近似最近邻索引取候选邻居的矩阵下标，没有索引时返回None
+        
+        评分有变化的用户在索引中的嵌入已过期，写回索引之前始终作为候选；
+        这类用户超过ann_refresh_rows个时批量写回，候选数量不会随增量更新无限增长。
+        """
+        if self.user_ann is None:
+            return None
+        
+        n_users = self.shape[0]
+        if self.user_ann.size < n_users or len(self._ann_pending) > self.ann_refresh_rows:
+            self._refresh_ann_index()
         
-        return neighbors
+        query = self._ann_vectors([user_idx])[0]
+        positions, _ = self.user_ann.query(query, n_neighbors * self.ANN_CANDIDATE_FACTOR)
+        pending = self._ann_pending
+        return np.unique(np.concatenate([positions, pending[pending < n_users]]))
+    
+    def _refresh_ann_index(self):
+        """把训练后新加入的用户加入近似最近邻索引，待写回的用户超过ann_refresh_rows个时按当前评分写回"""
+        with self._update_lock:
+            n_users = self.shape[0]
+            start = self.user_ann.size
+            if start < n_users:
+                self.user_ann.add(self._ann_vectors(np.arange(start, n_users)))
+            
+            # 刚加入索引的用户已按当前评分投影，不再需要作为候选
+            pending = self._ann_pending
+            pending = pending[pending < start]
+            if len(pending) > self.ann_refresh_rows:
+                self.user_ann.update(pending, self._ann_vectors(pending))
+                pending = np.empty(0, dtype=np.int64)
+            self._ann_pending = pending
+    
+    def _ann_vectors(self, user_indices) -> np.ndarray:
+        """用户在近似最近邻索引空间中的当前向量（降维嵌入或评分行的投影）"""
+        if self.user_embeddings is not None:
+            return self._user_embeddings_for(user_indices)
+        return self._project(self._rows(user_indices))
     
     def predict_rating(self, user_id: int, movie_id: int) -> float:
         """预测用户对电影的评分"""
-        if self.knn_model is None or user_id not in self.user_ids:
+        user_idx = self.user_index.get(user_id)
+        if not self.is_fitted or user_idx is None:
             return 0.0
         
-        # 获取用户索引
-        user_idx = self.user_ids.index(user_id)
-        
         # 获取电影索引
-        if movie_id not in self.movie_ids:
+        movie_idx = self.movie_index.get(movie_id)
+        if movie_idx is None:
             return 0.0
-        movie_idx = self.movie_ids.index(movie_id)
-        
-        # 获取最近邻
-        neighbors = self.get_user_neighbors(user_id)
         
-        if not neighbors:
-            return 0.0
+        return float(self._score_user_by_index(user_idx, np.array([movie_idx]))[0])
+    
+    def predict_ratings(self, user_id: int, movie_ids: List[int]) -> Dict[int, float]:
+        """
+        批量预测用户对多部电影的评分
         
-        # 计算加权平均评分
-        weighted_sum = 0.0
-        similarity_sum = 0.0
+        只查询一次最近邻，并在一次向量化计算中得到所有预测。
         
-        for neighbor_id, similarity in neighbors:
-            neighbor_idx = self.user_ids.index(neighbor_id)
-            neighbor_rating = self.rating_matrix[neighbor_idx][movie_idx]
+        Args:
+            user_id: 用户ID
+            movie_ids: 电影ID列表
             
-            if neighbor_rating > 0:  # 只考虑有评分的邻居
-                weighted_sum += similarity * neighbor_rating
-                similarity_sum += similarity
+        Returns:
+            {movie_id: 预测评分}，无法预测时为0.0
+        """
+        predictions = {int(movie_id): 0.0 for movie_id in movie_ids}
+        
+        user_idx = self.user_index.get(user_id)
+        if not self.is_fitted or user_idx is None:
+            return predictions
+        
+        known_ids = [movie_id for movie_id in predictions if movie_id in self.movie_index]
+        if not known_ids:
+            return predictions
+        
+        movie_indices = np.array([self.movie_index[movie_id] for movie_id in known_ids])
+        scores = self._score_user_by_index(user_idx, movie_indices)
+        
+        for movie_id, score in zip(known_ids, scores):
+            predictions[movie_id] = float(score)
+        
+        return predictions
+    
+    def _score_user_by_index(self, user_idx: int, movie_indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """预测用户对电影的评分，只查询一次最近邻；movie_indices为None时计算所有电影"""
+        neighbor_indices, similarities = self._neighbors_by_index(user_idx)
+        return self._score_movies_by_index(neighbor_indices, similarities, movie_indices)
+    
+    def _score_movies_by_index(self, neighbor_indices: np.ndarray, similarities: np.ndarray,
+                               movie_indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        一次矩阵运算预测用户对多部电影的评分
+        
+        只有评过该电影的邻居参与加权平均，结果限制在0.5-5.0之间，
+        无法预测的电影得分为0。movie_indices为None时计算所有电影。
+        """
+        n_movies = self.shape[1] if movie_indices is None else len(movie_indices)
+        predictions = np.zeros(n_movies)
+        if len(neighbor_indices) == 0:
+            return predictions
+        
+        neighbor_rows = self._rows(neighbor_indices)
+        if movie_indices is None:
+            neighbor_rows = neighbor_rows[:, :n_movies]
+        if movie_indices is not None:
+            neighbor_rows = neighbor_rows[:, movie_indices]
+        
+        # 邻居是否评过该电影的指示矩阵
+        rated_indicator = neighbor_rows.copy()
+        rated_indicator.data = (rated_indicator.data > 0).astype(np.float64)
+        
+        weighted_sum = neighbor_rows.T @ similarities
+        similarity_sum = rated_indicator.T @ similarities
         
-        if similarity_sum > 0:
-            predicted_rating = weighted_sum / similarity_sum
-            # 限制评分范围在0.5-5.0之间
-            return max(0.5, min(5.0, predicted_rating))
+        predictable = similarity_sum > 0
+        predictions[predictable] = np.clip(weighted_sum[predictable] / similarity_sum[predictable], 0.5, 5.0)
         
-        return 0.0
+        return predictions
     
     def recommend_for_user(self, user_id: int, n_recommendations: int = 10) -> List[Dict]:
         """为用户生成推荐"""
-        if self.knn_model is None or user_id not in self.user_ids:
+        user_idx = self.user_index.get(user_id)
+        if not self.is_fitted or user_idx is None:
             return []
         
-        # 获取用户已评分的电影
-        user_ratings = UserRating.objects.filter(user_id=user_id)
-        rated_movie_ids = set(user_ratings.values_list('movie_id', flat=True))
+        # 屏蔽用户已评分的电影（包括训练后新增的评分）
+        rated_movie_ids = UserRating.objects.filter(user_id=user_id).values_list('movie_id', flat=True)
+        rated_indices = [self.movie_index[mid] for mid in rated_movie_ids if mid in self.movie_index]
+        
+        return self._recommend_by_index(user_idx, n_recommendations, rated_indices)
+    
+    def _recommend_by_index(self, user_idx: int, n_recommendations: int,
+                            exclude_indices: Optional[List[int]] = None) -> List[Dict]:
+        """
+        按矩阵下标为用户生成推荐，不访问数据库
+        
+        Args:
+            user_idx: 用户在评分矩阵中的行下标
+            n_recommendations: 推荐数量
+            exclude_indices: 需要排除的电影列下标，为None时排除评分矩阵中该用户已评分的电影
+        """
+        if exclude_indices is None:
+            exclude_indices = self._user_row(user_idx)[0]
+        
+        # 一次性计算所有电影的预测评分
+        predictions = self._score_user_by_index(user_idx)
         
-        # 获取所有电影ID
-        all_movie_ids = Movie.objects.values_list('id', flat=True)
+        # 屏蔽已评分的电影和已不在电影表中的电影（计算期间新增的电影不在预测范围内）
+        exclude_indices = np.asarray(exclude_indices, dtype=np.int64)
+        predictions[exclude_indices[exclude_indices < len(predictions)]] = 0.0
+        predictions[np.isneginf(self.movie_popularity[:len(predictions)])] = 0.0
         
-        # 计算未评分电影的预测评分
-        recommendations = []
-        for movie_id in all_movie_ids:
-            if movie_id not in rated_movie_ids:
-                predicted_rating = self.predict_rating(user_id, movie_id)
-                if predicted_rating > 0:
-                    recommendations.append({
-                        'movie_id': movie_id,
-                        'score': predicted_rating,
-                        'algorithm': 'knn_collaborative_filtering'
-                    })
+        candidates = np.flatnonzero(predictions > 0)
+        if len(candidates) == 0:
+            return []
         
-        # 按评分排序并返回前N个
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
+        top_indices = self._select_top_n(candidates, predictions[candidates], n_recommendations)
         
-        return recommendations[:n_recommendations]
+        return [
+            {
+                'movie_id': int(self.movie_ids[movie_idx]),
+                'score': float(predictions[movie_idx]),
+                'algorithm': self.algorithm
+            }
+            for movie_idx in top_indices
+        ]
+    
+    def _select_top_n(self, candidates: np.ndarray, scores: np.ndarray, n: int) -> np.ndarray:
+        """用argpartition选出得分最高的N个候选，同分时按流行度降序"""
+        # 消除浮点累加顺序带来的微小误差，使同分判断稳定
+        scores = np.round(scores, 6)
+        if len(candidates) > n:
+            # 第N高的分数作为门槛，保留所有不低于门槛的候选以便正确处理并列
+            threshold = scores[np.argpartition(-scores, n - 1)[:n]].min()
+            keep = scores >= threshold
+            candidates, scores = candidates[keep], scores[keep]
+        
+        order = np.lexsort((-self.movie_popularity[candidates], -scores))
+        return candidates[order[:n]]
     
     def recommend_based_on_movie(self, movie_id: int, n_recommendations: int = 10) -> List[Dict]:
         """基于电影相似度生成推荐"""
         try:
-            # 获取目标电影
-            target_movie = Movie.objects.get(id=movie_id)
-            
-            # 获取电影特征向量（类型、评分、流行度等）
-            movie_features = self._get_movie_features()
+            # 获取缓存的电影特征矩阵（类型、评分、流行度等，已标准化并归一化）
+            features = content_feature_store.get()
             
-            if movie_id not in movie_features.index:
+            if features is None or movie_id not in features.movie_index:
                 return []
             
-            # 计算电影相似度
-            target_features = movie_features.loc[movie_id].values.reshape(1, -1)
-            similarities = cosine_similarity(target_features, movie_features.values)[0]
-            
-            # 获取相似电影
-            similar_movies = []
-            for idx, similarity in enumerate(similarities):
-                similar_movie_id = movie_features.index[idx]
-                if similar_movie_id != movie_id and similarity > self.min_similarity:
-                    similar_movies.append({
-                        'movie_id': similar_movie_id,
-                        'score': similarity,
-                        'algorithm': 'knn_content_based'
-                    })
+            # 一次矩阵-向量乘法得到相似度，多取一个以便排除目标电影自身
+            target_idx = features.movie_index[movie_id]
+            _, indices, similarities = cosine_topk(
+                features.matrix[target_idx:target_idx + 1],
+                features.matrix,
+                k=n_recommendations + 1,
+                min_similarity=self.min_similarity,
+                n_jobs=1,
+                normalized=True
+            )
             
-            # 按相似度排序并返回前N个
-            similar_movies.sort(key=lambda x: x['score'], reverse=True)
+            # 获取相似电影（已按相似度降序排列）
+            similar_movies = [
+                {
+                    'movie_id': int(features.movie_ids[idx]),
+                    'score': float(similarity),
+                    'algorithm': 'knn_content_based'
+                }
+                for idx, similarity in zip(indices, similarities)
+                if idx != target_idx and similarity > self.min_similarity
+            ]
             
             return similar_movies[:n_recommendations]
             
-        except Movie.DoesNotExist:
-            logger.error(f'电影不存在: {movie_id}')
-            return []
         except Exception as e:
             logger.error(f'基于电影的推荐失败: {e}')
             return []
     
-    def _get_movie_features(self) -> pd.DataFrame:
-        """获取电影特征矩阵"""
-        # 获取所有电影
-        movies = Movie.objects.prefetch_related('genres').all()
-        
-        # 准备特征数据
-        features_data = []
-        for movie in movies:
-            # 基本特征
-            features = {
-                'movie_id': movie.id,
-                'popularity': movie.popularity or 0.0,
-                'vote_average': movie.vote_average or 0.0,
-                'vote_count': movie.vote_count or 0,
-                'runtime': movie.runtime or 0,
-            }
-            
-            # 类型特征（one-hot编码）
-            genres = list(movie.genres.values_list('name', flat=True))
-            for genre in genres:
-                features[f'genre_{genre}'] = 1
-            
-            features_data.append(features)
-        
-        # 转换为DataFrame
-        df = pd.DataFrame(features_data)
-        
-        # 填充缺失值
-        df = df.fillna(0)
+    def save_recommendations(self, user_id: int, recommendations: List[Dict],
+                             algorithm: Optional[str] = None) -> int:
+        """保存推荐结果到数据库（替换该算法的旧推荐），返回写入的条数"""
+        return self.save_recommendations_bulk({user_id: recommendations}, algorithm=algorithm)
+    
+    def save_recommendations_bulk(self, recommendations_by_user: Dict[int, List[Dict]],
+                                  batch_size: int = 1000, algorithm: Optional[str] = None,
+                                  fail_silently: bool = True) -> int:
+        """
+        在一个事务中替换多个用户的推荐结果
         
-        # 设置索引
-        df.set_index('movie_id', inplace=True)
+        每个用户都删除algorithm的旧推荐（推荐结果为空时也删除，不会留下过期的推荐），
+        以及其推荐结果中出现的其他算法的旧推荐；用一次查询过滤掉已不存在的用户和电影，
+        再批量插入，查询数量与用户数、推荐数无关。
         
-        return df
-    
-    def save_recommendations(self, user_id: int, recommendations: List[Dict]):
-        """保存推荐结果到数据库"""
+        Args:
+            recommendations_by_user: {用户ID: 推荐结果列表}
+            batch_size: 每条INSERT语句包含的行数
+            algorithm: 被替换的推荐算法，默认为本推荐器的算法
+            fail_silently: 为False时保存失败抛出异常，否则记录日志并返回0
+            
+        Returns:
+            写入的推荐条数
+        """
+        algorithm = algorithm or self.algorithm
         try:
-            user = CustomUser.objects.get(id=user_id)
-            
-            # 删除旧的推荐
-            Recommendation.objects.filter(
-                user=user, 
-                algorithm=recommendations[0]['algorithm'] if recommendations else ''
-            ).delete()
-            
-            # 保存新的推荐
-            for rec in recommendations:
-                try:
-                    movie = Movie.objects.get(id=rec['movie_id'])
-                    Recommendation.objects.create(
-                        user=user,
-                        movie=movie,
-                        score=rec['score'],
-                        algorithm=rec['algorithm'],
-                        reason=self._generate_recommendation_reason(rec)
-                    )
-                except Movie.DoesNotExist:
+            existing_users = set(CustomUser.objects.only('id').in_bulk(list(recommendations_by_user)))
+            movie_ids = {
+                rec['movie_id']
+                for recommendations in recommendations_by_user.values()
+                for rec in recommendations
+            }
+            existing_movies = set(Movie.objects.only('id').in_bulk(list(movie_ids)))
+            
+            # 按算法分组需要替换的用户
+            users_by_algorithm = defaultdict(set)
+            rows = []
+            for user_id, recommendations in recommendations_by_user.items():
+                if user_id not in existing_users:
+                    logger.warning(f'用户不存在，跳过保存推荐: {user_id}')
                     continue
+                
+                users_by_algorithm[algorithm].add(user_id)
+                for rec in recommendations:
+                    users_by_algorithm[rec['algorithm']].add(user_id)
+                    if rec['movie_id'] in existing_movies:
+                        rows.append(Recommendation(
+                            user_id=user_id,
+                            movie_id=rec['movie_id'],
+                            score=rec['score'],
+                            algorithm=rec['algorithm'],
+                            reason=self._generate_recommendation_reason(rec),
+                            model_version=self.version or ''
+                        ))
+            
+            if not users_by_algorithm:
+                return 0
+            
+            stale = Q()
+            for algorithm, user_ids in users_by_algorithm.items():
+                stale |= Q(algorithm=algorithm, user_id__in=list(user_ids))
+            
+            with transaction.atomic():
+                Recommendation.objects.filter(stale).delete()
+                Recommendation.objects.bulk_create(rows, batch_size=batch_size)
             
-            logger.info(f'已保存{len(recommendations)}条推荐结果给用户{user_id}')
+            logger.info(f'已保存{len(rows)}条推荐结果给{len(existing_users)}个用户')
+            return len(rows)
             
         except Exception as e:
+            if not fail_silently:
+                raise
             logger.error(f'保存推荐结果失败: {e}')
+            return 0
     
     def _generate_recommendation_reason(self, recommendation: Dict) -> str:
         """生成推荐理由"""
@@ -313,7 +992,17 @@ class KNNRecommender:
         
         if algorithm == 'knn_collaborative_filtering':
             return f'基于相似用户评分预测，推荐分数: {score:.2f}/5.0'
+        elif algorithm == 'item_knn_collaborative_filtering':
+            return f'基于您评价过的相似电影预测，推荐分数: {score:.2f}/5.0'
+        elif algorithm == 'als_matrix_factorization':
+            return f'基于矩阵分解的用户与电影隐因子预测，推荐分数: {score:.2f}'
         elif algorithm == 'knn_content_based':
             return f'基于电影内容相似度，相似度: {score:.2%}'
+        elif algorithm == 'popularity_based':
+            return f'热门高分电影，加权评分: {score:.1f}/10'
+        elif algorithm == 'cold_start':
+            return f'根据您偏好的类型推荐的热门高分电影，加权评分: {score:.1f}/10'
+        elif algorithm == 'hybrid':
+            return f'综合相似用户、内容相似度与热度，综合得分: {score:.2f}'
         else:
             return f'推荐分数: {score:.2f}'
\ No newline at end of file
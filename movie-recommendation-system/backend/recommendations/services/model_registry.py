@@ -0,0 +1,537 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db.models import Count, Max
+
+from users.models import UserRating
+from recommendations.models import RecommendationConfig
+from recommendations.services.knn_recommender import KNNRecommender, ProgressCallback
+from recommendations.services.item_recommender import ItemKNNRecommender
+from recommendations.services.als_recommender import ALSRecommender
+
+logger = logging.getLogger(__name__)
+
+# 需要训练的协同过滤算法及其推荐器类
+RECOMMENDER_CLASSES = {
+    KNNRecommender.algorithm: KNNRecommender,
+    ItemKNNRecommender.algorithm: ItemKNNRecommender,
+    ALSRecommender.algorithm: ALSRecommender,
+}
+
+
+class ModelRegistry:
+    """进程级已训练模型注册表
+
+    按 (k_neighbors, min_similarity, algorithm) 缓存训练好的推荐器，
+    视图只读使用。评分的增删改通过信号增量同步到已缓存的模型，
+    仅在显式要求、评分数据在本进程之外变化较大或模型超过最长使用时间时重新训练。
+
+    训练好的模型按版本导出到模型文件目录，CURRENT指针指向当前服务的版本。
+    其他工作进程以内存映射方式加载同一份文件，不再各自训练；
+    检测到CURRENT指向新版本时原子地切换，也可以回滚到之前的版本。
+
+    同一模型同时只进行一次训练（single-flight）：进程内用事件合并并发请求，
+    进程之间用模型文件目录中的锁文件协调。有旧模型的请求直接使用旧模型，
+    没有旧模型的请求等待正在进行的训练完成后共享其结果。
+    """
+
+    def __init__(self, retrain_threshold: Optional[float] = None, check_interval: Optional[int] = None,
+                 max_age: Optional[int] = None, model_dir: Optional[str] = None,
+                 keep_versions: Optional[int] = None, fit_wait_timeout: Optional[int] = None,
+                 fit_lock_timeout: Optional[int] = None):
+        """
+        初始化模型注册表
+
+        Args:
+            retrain_threshold: 评分数量变化比例达到该值时重新训练
+            check_interval: 两次数据变化检查之间的最小间隔（秒）
+            max_age: 模型最长使用时间（秒），超过后若数据有变化则完整重训以保证一致性
+            model_dir: 模型文件目录，为空时不导出也不加载模型文件
+            keep_versions: 每个模型保留的版本数量
+            fit_wait_timeout: 没有旧模型时等待其他训练完成的最长时间（秒）
+            fit_lock_timeout: 锁文件超过该时间（秒）视为持有进程已退出，可被接管
+        """
+        self.retrain_threshold = (
+            retrain_threshold if retrain_threshold is not None
+            else getattr(settings, 'RECOMMENDATION_RETRAIN_THRESHOLD', 0.05)
+        )
+        self.check_interval = (
+            check_interval if check_interval is not None
+            else getattr(settings, 'RECOMMENDATION_REGISTRY_CHECK_INTERVAL', 60)
+        )
+        self.max_age = (
+            max_age if max_age is not None
+            else getattr(settings, 'RECOMMENDATION_MODEL_MAX_AGE', 6 * 3600)
+        )
+        self.model_dir = (
+            model_dir if model_dir is not None
+            else getattr(settings, 'RECOMMENDATION_MODEL_DIR', '')
+        )
+        self.keep_versions = (
+            keep_versions if keep_versions is not None
+            else getattr(settings, 'RECOMMENDATION_MODEL_KEEP_VERSIONS', 5)
+        )
+        self.fit_wait_timeout = (
+            fit_wait_timeout if fit_wait_timeout is not None
+            else getattr(settings, 'RECOMMENDATION_FIT_WAIT_TIMEOUT', 300)
+        )
+        self.fit_lock_timeout = (
+            fit_lock_timeout if fit_lock_timeout is not None
+            else getattr(settings, 'RECOMMENDATION_FIT_LOCK_TIMEOUT', 3600)
+        )
+        self._models: Dict[Tuple, Dict] = {}
+        self._lock = threading.Lock()
+        # 进程内正在进行的训练，键为模型缓存键
+        self._inflight: Dict[Tuple, threading.Event] = {}
+
+    @staticmethod
+    def make_key(k_neighbors: int, min_similarity: float, algorithm: str) -> Tuple:
+        """生成模型缓存键"""
+        return (int(k_neighbors), float(min_similarity), algorithm)
+
+    def get_model(self, k_neighbors: int = 20, min_similarity: float = 0.1,
+                  algorithm: str = 'knn_collaborative_filtering',
+                  force_retrain: bool = False,
+                  progress_callback: ProgressCallback = None) -> Optional[KNNRecommender]:
+        """
+        获取已训练的模型，必要时训练
+
+        返回的模型由所有请求共享，调用方不得修改其状态。
+
+        Args:
+            k_neighbors: K近邻数量
+            min_similarity: 最小相似度阈值
+            algorithm: 推荐算法
+            force_retrain: 是否强制重新训练
+            progress_callback: 需要训练时，进入每个训练阶段时以阶段名调用
+
+        Returns:
+            训练好的推荐器，训练失败时返回None
+        """
+        key = self.make_key(k_neighbors, min_similarity, algorithm)
+
+        with self._lock:
+            entry = self._models.get(key)
+
+        if entry is None and not force_retrain:
+            entry = self._load_artifact(key)
+
+        if entry is not None and not force_retrain:
+            if time.monotonic() - entry['checked_at'] < self.check_interval:
+                return entry['model']
+
+            # 其他进程导出了新版本或执行了回滚时直接切换，无需自己训练
+            if self.current_version(key) != (entry['version'], entry['pinned']):
+                entry = self._load_artifact(key) or entry
+
+            snapshot = self._data_snapshot()
+            if not self._needs_retrain(entry, snapshot):
+                entry['checked_at'] = time.monotonic()
+                return entry['model']
+
+            logger.info(f'评分数据变化较大，重新训练模型: {key}')
+
+        return self._train(key, progress_callback, force=force_retrain,
+                           stale=None if force_retrain else entry)
+
+    def get_ready_model(self, k_neighbors: int = 20, min_similarity: float = 0.1,
+                        algorithm: str = 'knn_collaborative_filtering') -> Optional[KNNRecommender]:
+        """
+        获取已就绪的模型，不训练也不等待训练
+
+        只使用注册表中缓存的模型或CURRENT指向的模型文件（超过检查间隔时切换到其他进程导出的新版本），
+        不检查评分数据变化，有延迟预算的调用方使用。
+
+        Returns:
+            已就绪的推荐器，没有缓存的模型也没有模型文件时返回None
+        """
+        key = self.make_key(k_neighbors, min_similarity, algorithm)
+
+        with self._lock:
+            entry = self._models.get(key)
+
+        if entry is None:
+            entry = self._load_artifact(key)
+        elif (time.monotonic() - entry['checked_at'] >= self.check_interval
+              and self.current_version(key) != (entry['version'], entry['pinned'])):
+            entry = self._load_artifact(key) or entry
+
+        return entry['model'] if entry is not None else None
+
+    def invalidate(self, k_neighbors: Optional[int] = None, min_similarity: Optional[float] = None,
+                   algorithm: Optional[str] = None):
+        """移除缓存的模型，不传参数时清空全部"""
+        with self._lock:
+            if k_neighbors is None and min_similarity is None and algorithm is None:
+                self._models.clear()
+                return
+            self._models.pop(self.make_key(k_neighbors, min_similarity, algorithm), None)
+
+    def apply_rating_update(self, user_id: int, movie_id: int, rating: float, created: bool):
+        """将新增或修改的评分增量同步到所有已缓存的模型"""
+        for entry in self._entries():
+            entry['model'].update_rating(user_id, movie_id, rating)
+            if created:
+                self._adjust_snapshot_count(entry, 1)
+
+    def apply_rating_removal(self, user_id: int, movie_id: int):
+        """将删除的评分增量同步到所有已缓存的模型"""
+        for entry in self._entries():
+            entry['model'].remove_rating(user_id, movie_id)
+            self._adjust_snapshot_count(entry, -1)
+
+    def _adjust_snapshot_count(self, entry: Dict, delta: int):
+        """在注册表锁内调整条目的评分数量快照（复制后替换，_needs_retrain读到的总是完整的快照）"""
+        with self._lock:
+            entry['snapshot'] = {**entry['snapshot'], 'count': entry['snapshot']['count'] + delta}
+
+    def artifact_root(self, key: Tuple) -> str:
+        """模型文件根目录，其下versions/保存各个版本，CURRENT指向当前服务的版本"""
+        k_neighbors, min_similarity, algorithm = key
+        return os.path.join(self.model_dir, f'{algorithm}-k{k_neighbors}-s{min_similarity:g}')
+
+    def version_path(self, key: Tuple, version: str) -> str:
+        """指定版本的模型文件目录"""
+        return os.path.join(self.artifact_root(key), 'versions', version)
+
+    def current_version(self, key: Tuple) -> Tuple[Optional[str], bool]:
+        """读取CURRENT指针，返回(当前版本, 是否已固定)，不存在时版本为None"""
+        if not self.model_dir:
+            return None, False
+        try:
+            with open(os.path.join(self.artifact_root(key), 'CURRENT'), encoding='utf-8') as f:
+                pointer = json.load(f)
+        except (OSError, ValueError):
+            return None, False
+        return pointer.get('version'), pointer.get('pinned', False)
+
+    def list_versions(self, key: Tuple) -> List[Dict]:
+        """列出已保存的模型版本清单，按导出时间从新到旧排列"""
+        current, _ = self.current_version(key)
+        manifests = []
+        for version, manifest in self._ordered_versions(key):
+            if manifest is None:
+                continue
+            manifest.pop('stale_neighbor_rows', None)
+            manifest['is_current'] = version == current
+            manifests.append(manifest)
+        return manifests
+
+    def _ordered_versions(self, key: Tuple) -> List[Tuple[str, Optional[Dict]]]:
+        """
+        按清单中的导出时间从新到旧排列版本目录，返回[(版本, 清单)]
+
+        不按目录名排序：旧格式的版本号带随机后缀且为本地时间，同一秒内导出的版本按名称排序会乱序。
+        清单缺失或损坏的目录清单为None，排在最后。
+        """
+        versions_dir = os.path.join(self.artifact_root(key), 'versions')
+        if not self.model_dir or not os.path.isdir(versions_dir):
+            return []
+
+        versions = []
+        for version in os.listdir(versions_dir):
+            # 跳过正在写入或待删除的临时目录
+            if version.startswith('.'):
+                continue
+            try:
+                with open(os.path.join(versions_dir, version, 'manifest.json'), encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                manifest = None
+            versions.append((version, manifest))
+
+        versions.sort(
+            key=lambda item: (item[1] is not None, (item[1] or {}).get('exported_at', 0.0), item[0]),
+            reverse=True
+        )
+        return versions
+
+    def rollback(self, key: Tuple, version: Optional[str] = None) -> Optional[KNNRecommender]:
+        """
+        将服务的模型切换到指定版本（默认为当前版本之前导出的一个版本）
+
+        回滚后的版本会被固定，不会因数据变化自动重新训练，直到下次显式训练。
+
+        Returns:
+            切换后的推荐器，版本不存在或加载失败时返回None
+        """
+        if version is None:
+            current, _ = self.current_version(key)
+            versions = [manifest['version'] for manifest in self.list_versions(key)]
+            # 当前版本之后的都是更早导出的版本
+            older = versions[versions.index(current) + 1:] if current in versions else versions
+            if not older:
+                return None
+            version = older[0]
+
+        if not os.path.exists(os.path.join(self.version_path(key, version), 'manifest.json')):
+            return None
+
+        self._set_current(key, version, pinned=True)
+        entry = self._load_artifact(key)
+        if entry is None:
+            return None
+
+        logger.info(f'模型已回滚: {key} -> {version}')
+        return entry['model']
+
+    def _set_current(self, key: Tuple, version: str, pinned: bool = False):
+        """原子地更新CURRENT指针（写临时文件后os.replace）"""
+        root = self.artifact_root(key)
+        fd, staging = tempfile.mkstemp(prefix='.CURRENT-', dir=root)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'pinned': pinned}, f)
+        os.replace(staging, os.path.join(root, 'CURRENT'))
+
+    def _load_artifact(self, key: Tuple) -> Optional[Dict]:
+        """
+        以内存映射方式加载CURRENT指向的模型版本并原子替换注册表中的模型
+
+        正在处理的请求仍持有旧模型的引用，会在旧版本上完成；之后的请求使用新版本。
+        文件不存在或损坏时返回None。
+        """
+        version, pinned = self.current_version(key)
+        if version is None:
+            return None
+
+        recommender_class = RECOMMENDER_CLASSES.get(key[2], KNNRecommender)
+        try:
+            recommender = recommender_class.load(self.version_path(key, version))
+        except Exception as e:
+            logger.error(f'加载模型文件失败: {key} {version}: {e}')
+            return None
+
+        manifest = recommender.manifest
+        snapshot = {
+            'count': manifest['snapshot']['count'],
+            'latest': datetime.fromisoformat(manifest['snapshot']['latest']) if manifest['snapshot']['latest'] else None,
+        }
+        age = max(0.0, time.time() - manifest['exported_at'])
+
+        entry = {
+            'model': recommender,
+            'version': version,
+            'pinned': pinned,
+            'snapshot': snapshot,
+            'trained_at': time.monotonic() - age,
+            # 立即检查一次数据变化，避免长期使用过期的模型文件
+            'checked_at': float('-inf'),
+        }
+        with self._lock:
+            self._models[key] = entry
+
+        logger.info(f'已加载模型版本: {key} {version}')
+        return entry
+
+    def _export_artifact(self, key: Tuple, recommender: KNNRecommender, snapshot: Dict) -> bool:
+        """导出新版本的模型文件并将CURRENT指向它，供其他工作进程加载"""
+        if not self.model_dir:
+            return False
+
+        config = RecommendationConfig.objects.filter(algorithm=key[2], is_active=True).first()
+        parameters = dict(config.parameters) if config else {}
+        parameters.update(k_neighbors=recommender.k_neighbors, min_similarity=recommender.min_similarity)
+
+        try:
+            recommender.export(self.version_path(key, recommender.version), metadata={
+                'parameters': parameters,
+                'exported_at': time.time(),
+                'snapshot': {
+                    'count': snapshot['count'],
+                    'latest': snapshot['latest'].isoformat() if snapshot['latest'] else None,
+                },
+            })
+            self._set_current(key, recommender.version)
+            self._prune_versions(key)
+        except Exception as e:
+            logger.error(f'导出模型文件失败: {key}: {e}')
+            return False
+
+        return True
+
+    def _prune_versions(self, key: Tuple):
+        """只保留最近导出的若干个版本（当前版本始终保留）"""
+        current, _ = self.current_version(key)
+        versions_dir = os.path.join(self.artifact_root(key), 'versions')
+        for version, _ in self._ordered_versions(key)[max(self.keep_versions, 1):]:
+            if version != current:
+                shutil.rmtree(os.path.join(versions_dir, version), ignore_errors=True)
+
+    def _entries(self):
+        """当前缓存条目的快照列表"""
+        with self._lock:
+            return list(self._models.values())
+
+    def _train(self, key: Tuple, progress_callback: ProgressCallback = None, force: bool = False,
+               stale: Optional[Dict] = None) -> Optional[KNNRecommender]:
+        """
+        合并并发的训练请求，同一模型同时只进行一次训练
+
+        Args:
+            key: 模型缓存键
+            progress_callback: 训练进度回调
+            force: 强制训练，等待正在进行的训练结束后仍重新训练
+            stale: 当前缓存的旧模型条目，有训练正在进行时直接返回旧模型
+        """
+        while True:
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    break
+
+            # 本进程已有线程在训练
+            if stale is not None:
+                return stale['model']
+            if not event.wait(self.fit_wait_timeout):
+                logger.warning(f'等待模型训练超时: {key}')
+                return None
+            if not force:
+                with self._lock:
+                    entry = self._models.get(key)
+                return entry['model'] if entry is not None else None
+
+        try:
+            return self._train_across_processes(key, progress_callback, force, stale)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def _train_across_processes(self, key: Tuple, progress_callback: ProgressCallback, force: bool,
+                                stale: Optional[Dict]) -> Optional[KNNRecommender]:
+        """持有锁文件训练；其他进程正在训练时返回旧模型，或等待其完成后加载其导出的版本"""
+        if not self.model_dir:
+            return self._fit(key, progress_callback)
+
+        deadline = time.monotonic() + self.fit_wait_timeout
+        while True:
+            lock_path = self._acquire_fit_lock(key)
+            if lock_path is not None:
+                break
+            if stale is not None:
+                return stale['model']
+            if time.monotonic() >= deadline:
+                logger.warning(f'等待其他进程训练模型超时: {key}')
+                return None
+            time.sleep(0.5)
+
+        try:
+            # 等待期间其他进程可能已导出足够新的版本
+            if not force:
+                entry = self._load_artifact(key)
+                if entry is not None and not self._needs_retrain(entry, self._data_snapshot()):
+                    entry['checked_at'] = time.monotonic()
+                    return entry['model']
+
+            return self._fit(key, progress_callback)
+        finally:
+            self._release_fit_lock(lock_path)
+
+    def _acquire_fit_lock(self, key: Tuple) -> Optional[str]:
+        """
+        以O_EXCL创建锁文件，成功时返回锁文件路径
+
+        超过fit_lock_timeout的锁文件视为持有进程已异常退出，删除后重试。
+        """
+        root = self.artifact_root(key)
+        os.makedirs(root, exist_ok=True)
+        lock_path = os.path.join(root, '.fit.lock')
+
+        for _ in range(2):
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(lock_path).st_mtime < self.fit_lock_timeout:
+                        return None
+                    logger.warning(f'接管过期的训练锁: {lock_path}')
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+                continue
+
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return lock_path
+
+        return None
+
+    @staticmethod
+    def _release_fit_lock(lock_path: str):
+        """删除锁文件"""
+        try:
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+    def _fit(self, key: Tuple, progress_callback: ProgressCallback = None) -> Optional[KNNRecommender]:
+        """训练模型并放入注册表"""
+        k_neighbors, min_similarity, algorithm = key
+
+        snapshot = self._data_snapshot()
+        recommender_class = RECOMMENDER_CLASSES.get(algorithm, KNNRecommender)
+        recommender = recommender_class(k_neighbors=k_neighbors, min_similarity=min_similarity)
+
+        # 以当前服务的模型为初始值（ALS沿用上一次的因子）
+        with self._lock:
+            previous = self._models.get(key)
+        if previous is not None:
+            recommender.warm_start(previous['model'])
+
+        if not recommender.fit(progress_callback):
+            return None
+
+        if self.model_dir:
+            recommender._report_progress(progress_callback, 'export')
+        self._export_artifact(key, recommender, snapshot)
+
+        # 原子替换，正在处理的请求在旧模型上完成
+        with self._lock:
+            self._models[key] = {
+                'model': recommender,
+                'version': recommender.version,
+                'pinned': False,
+                'snapshot': snapshot,
+                'trained_at': time.monotonic(),
+                'checked_at': time.monotonic(),
+            }
+
+        return recommender
+
+    def _data_snapshot(self) -> Dict:
+        """获取评分数据快照（数量与最近更新时间）"""
+        return UserRating.objects.aggregate(count=Count('id'), latest=Max('updated_at'))
+
+    def _needs_retrain(self, entry: Dict, new: Dict) -> bool:
+        """判断评分数据变化是否足以重新训练"""
+        with self._lock:
+            old = entry['snapshot']
+
+        # 回滚后固定的版本不自动重新训练
+        if entry['pinned']:
+            return False
+
+        # 增量更新只是近似，超过最长使用时间且数据有变化时做一次完整重训
+        if time.monotonic() - entry['trained_at'] >= self.max_age and new != old:
+            return True
+
+        if new['latest'] is None:
+            return old['latest'] is not None
+
+        if old['latest'] is None:
+            return True
+
+        changed = abs(new['count'] - old['count'])
+        return changed / max(old['count'], 1) >= self.retrain_threshold
+
+
+# 进程级共享的模型注册表
+model_registry = ModelRegistry()
@@ -0,0 +1,301 @@
+import time
+import threading
+import numpy as np
+import logging
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Sum
+
+from movies.models import Movie
+from users.models import CustomUser, UserRating
+from recommendations.services.knn_recommender import KNNRecommender
+
+logger = logging.getLogger(__name__)
+
+
+class PopularityRanking(NamedTuple):
+    """按贝叶斯加权评分降序排列的电影榜单"""
+    movie_ids: np.ndarray
+    scores: np.ndarray
+    # 电影ID -> 榜单中的位置
+    positions: Dict[int, int]
+    # 类型ID -> 该类型前N部电影在榜单中的位置（升序）
+    genre_positions: Dict[int, np.ndarray]
+
+
+class PopularityStore:
+    """进程级热门电影榜单缓存
+
+    每部电影的得分为贝叶斯加权平均分：TMDB评分（vote_average × vote_count）与本站评分
+    （0.5-5分换算为10分制）合并为一个平均分，再按评分人数向全局平均分收缩，
+    评分人数少的电影不会因为个别高分排到前面。
+
+    按用户取榜单时用一次查询读取该用户已评分的电影并排除，其他进程中提交的评分也能立即生效。
+    超过最长使用时间后在后台线程中重建，重建期间继续使用旧榜单；电影变化时由信号使榜单失效，
+    下次请求时重新构建。
+    """
+
+    # 本站评分（0.5-5分）换算为TMDB的10分制
+    LOCAL_RATING_SCALE = 2.0
+
+    def __init__(self, max_age: Optional[int] = None, min_votes: Optional[float] = None,
+                 genre_top_n: Optional[int] = None):
+        """
+        初始化榜单缓存
+
+        Args:
+            max_age: 榜单最长使用时间（秒），默认取RECOMMENDATION_POPULARITY_MAX_AGE
+            min_votes: 贝叶斯先验的评分人数，默认取RECOMMENDATION_POPULARITY_MIN_VOTES，
+                为0时取评分人数的80%分位数
+            genre_top_n: 每个类型预计算的电影数量，默认取RECOMMENDATION_COLD_START_GENRE_TOP_N
+        """
+        self.max_age = (
+            max_age if max_age is not None
+            else getattr(settings, 'RECOMMENDATION_POPULARITY_MAX_AGE', 600)
+        )
+        self.min_votes = (
+            min_votes if min_votes is not None
+            else getattr(settings, 'RECOMMENDATION_POPULARITY_MIN_VOTES', 0)
+        )
+        self.genre_top_n = genre_top_n or getattr(settings, 'RECOMMENDATION_COLD_START_GENRE_TOP_N', 100)
+        self._ranking: Optional[PopularityRanking] = None
+        self._built_at = 0.0
+        self._version = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self) -> Optional[PopularityRanking]:
+        """获取榜单：没有榜单时同步构建，过期时返回旧榜单并在后台重建；没有电影时返回None"""
+        ranking = self._ranking
+        if ranking is not None:
+            if time.monotonic() - self._built_at >= self.max_age:
+                self._refresh_in_background()
+            return ranking
+
+        with self._lock:
+            if self._ranking is None:
+                # 构建期间被失效时结果不缓存，但仍返回给本次调用，不会因此得到None
+                return self._rebuild()
+            return self._ranking
+
+    def invalidate(self):
+        """使缓存的榜单失效"""
+        self._version += 1
+        self._ranking = None
+
+    def top_for_user(self, user_id: int, n: int) -> List[Tuple[int, float]]:
+        """
+        获取用户未评分的前n部电影
+
+        Returns:
+            [(电影ID, 得分)]，按得分降序
+        """
+        ranking = self.get()
+        if ranking is None or n <= 0:
+            return []
+
+        return self._to_movies(ranking, self._top_positions(ranking, self._rated_positions(ranking, user_id), n))
+
+    def top_for_genres(self, user_id: int, genre_ids: List[int], n: int) -> List[Tuple[int, float]]:
+        """
+        合并多个类型的预计算榜单，获取用户未评分的前n部电影
+
+        同时属于多个所选类型的电影排在前面，匹配数相同时按总榜顺序；不足n部时用总榜补足。
+
+        Returns:
+            [(电影ID, 得分)]
+        """
+        ranking = self.get()
+        if ranking is None or n <= 0:
+            return []
+
+        rated = self._rated_positions(ranking, user_id)
+        lists = [ranking.genre_positions[genre_id] for genre_id in genre_ids if genre_id in ranking.genre_positions]
+        picked = np.empty(0, dtype=np.int64)
+        if lists:
+            candidates, matches = np.unique(np.concatenate(lists), return_counts=True)
+            keep = ~np.isin(candidates, rated)
+            candidates, matches = candidates[keep], matches[keep]
+            picked = candidates[np.lexsort((candidates, -matches))][:n]
+
+        if len(picked) < n:
+            fill = self._top_positions(ranking, rated, n + len(picked))
+            fill = fill[~np.isin(fill, picked)][:n - len(picked)]
+            picked = np.concatenate([picked, fill])
+
+        return self._to_movies(ranking, picked)
+
+    @staticmethod
+    def _rated_positions(ranking: PopularityRanking, user_id: int) -> np.ndarray:
+        """用户已评分电影在榜单中的位置（一次查询，构建后新增的电影不在榜单中）"""
+        positions = [
+            ranking.positions[movie_id]
+            for movie_id in UserRating.objects.filter(user_id=user_id).values_list('movie_id', flat=True).order_by()
+            if movie_id in ranking.positions
+        ]
+        return np.array(positions, dtype=np.int64)
+
+    @staticmethod
+    def _top_positions(ranking: PopularityRanking, rated: np.ndarray, n: int) -> np.ndarray:
+        """
+        用户未评分的前n部电影在榜单中的位置
+
+        前n部未评分电影一定在榜单前 n + 已评分数量 个位置内，只在这一段上用位图排除已评分电影。
+        """
+        window = min(len(ranking.movie_ids), n + len(rated))
+        unrated = np.ones(window, dtype=bool)
+        unrated[rated[rated < window]] = False
+        return np.flatnonzero(unrated)[:n]
+
+    @staticmethod
+    def _to_movies(ranking: PopularityRanking, positions: np.ndarray) -> List[Tuple[int, float]]:
+        """榜单位置转换为(电影ID, 得分)"""
+        return [(int(ranking.movie_ids[pos]), float(ranking.scores[pos])) for pos in positions]
+
+    def _refresh_in_background(self):
+        """在后台线程中重建过期的榜单，同时只有一个重建"""
+        with self._refresh_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                with self._lock:
+                    self._rebuild()
+            except Exception as e:
+                logger.error(f'热门电影榜单重建失败: {e}')
+            finally:
+                self._refreshing = False
+                connections.close_all()
+
+        threading.Thread(target=refresh, name='popularity-refresh', daemon=True).start()
+
+    def _rebuild(self) -> Optional[PopularityRanking]:
+        """构建榜单并替换（需持有self._lock），返回新构建的榜单"""
+        version = self._version
+        built_at = time.monotonic()
+        ranking = self._build()
+
+        # 构建期间电影发生变化时本次结果不缓存，下次请求重新构建
+        if version == self._version:
+            self._ranking = ranking
+            self._built_at = built_at
+        return ranking
+
+    def _build(self) -> Optional[PopularityRanking]:
+        """从数据库构建榜单（三次查询：电影字段、本站评分汇总、电影-类型关联）"""
+        rows = list(Movie.objects.values_list('id', 'vote_average', 'vote_count', 'popularity').order_by('id'))
+        if not rows:
+            return None
+
+        movie_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        vote_average = np.array([row[1] or 0.0 for row in rows], dtype=np.float64)
+        vote_count = np.array([row[2] or 0 for row in rows], dtype=np.float64)
+        popularity = np.array([row[3] or 0.0 for row in rows], dtype=np.float64)
+
+        # 合并本站评分：评分总和与人数加到TMDB的评分上
+        rating_sums = vote_average * vote_count
+        local = (
+            UserRating.objects.values('movie_id')
+            .annotate(count=Count('id'), total=Sum('rating'))
+            .order_by()
+        )
+        for row in local:
+            idx = np.searchsorted(movie_ids, row['movie_id'])
+            if idx < len(movie_ids) and movie_ids[idx] == row['movie_id']:
+                vote_count[idx] += row['count']
+                rating_sums[idx] += row['total'] * self.LOCAL_RATING_SCALE
+
+        scores = self._bayesian_scores(rating_sums, vote_count)
+
+        # 得分相同时按流行度、ID排序
+        order = np.lexsort((movie_ids, -popularity, -scores))
+        ranked_ids = movie_ids[order]
+        positions = {int(movie_id): pos for pos, movie_id in enumerate(ranked_ids)}
+
+        # 每个类型取榜单中最靠前的genre_top_n部电影
+        by_genre = defaultdict(list)
+        for movie_id, genre_id in Movie.genres.through.objects.values_list('movie_id', 'genre_id').order_by():
+            position = positions.get(movie_id)
+            if position is not None:
+                by_genre[genre_id].append(position)
+        genre_positions = {
+            genre_id: np.sort(np.array(genre_positions, dtype=np.int32))[:self.genre_top_n]
+            for genre_id, genre_positions in by_genre.items()
+        }
+
+        logger.info(
+            f'热门电影榜单构建完成，电影数: {len(ranked_ids)}，类型数: {len(genre_positions)}'
+        )
+        return PopularityRanking(ranked_ids, scores[order].astype(np.float32), positions, genre_positions)
+
+    def _bayesian_scores(self, rating_sums: np.ndarray, vote_count: np.ndarray) -> np.ndarray:
+        """贝叶斯加权平均分：(v × R + m × C) / (v + m)，C为全局平均分，m为先验评分人数"""
+        rated = vote_count > 0
+        if not rated.any():
+            return np.zeros(len(vote_count))
+
+        global_mean = rating_sums[rated].sum() / vote_count[rated].sum()
+        min_votes = self.min_votes or max(1.0, float(np.percentile(vote_count[rated], 80)))
+        return (rating_sums + min_votes * global_mean) / (vote_count + min_votes)
+
+
+# 进程级共享的热门电影榜单缓存
+popularity_store = PopularityStore()
+
+
+class PopularityRecommender:
+    """热门推荐器：从预计算的榜单中取用户未评分的电影
+
+    不需要训练，也不依赖用户的评分数量，作为新用户和其他算法没有结果时的兜底推荐。
+    """
+
+    algorithm = 'popularity_based'
+
+    def __init__(self, store: Optional[PopularityStore] = None):
+        self.store = store or popularity_store
+
+    def recommend_for_user(self, user_id: int, n_recommendations: int = 10) -> List[Dict]:
+        """为用户生成推荐（分数为10分制的贝叶斯加权评分）"""
+        return [
+            {'movie_id': movie_id, 'score': score, 'algorithm': self.algorithm}
+            for movie_id, score in self.store.top_for_user(user_id, n_recommendations)
+        ]
+
+    def save_recommendations(self, user_id: int, recommendations: List[Dict]) -> int:
+        """保存推荐结果到数据库（替换该算法的旧推荐），返回写入的条数"""
+        return KNNRecommender().save_recommendations(user_id, recommendations, algorithm=self.algorithm)
+
+
+class ColdStartRecommender(PopularityRecommender):
+    """冷启动推荐器：评分很少的用户从偏好类型的预计算榜单中取电影
+
+    合并用户偏好类型（CustomUser.preferred_genres）的前N部电影，没有设置偏好类型时
+    即为热门推荐。不需要评分矩阵或训练好的模型，新注册的用户也能立即得到推荐。
+    """
+
+    algorithm = 'cold_start'
+
+    def recommend_for_user(self, user_id: int, n_recommendations: int = 10,
+                           genre_ids: Optional[List[int]] = None) -> List[Dict]:
+        """
+        为用户生成推荐
+
+        Args:
+            user_id: 用户ID
+            n_recommendations: 推荐数量
+            genre_ids: 偏好类型ID，默认读取用户的preferred_genres
+        """
+        if genre_ids is None:
+            genre_ids = list(CustomUser.preferred_genres.through.objects.filter(
+                customuser_id=user_id
+            ).values_list('genre_id', flat=True))
+
+        return [
+            {'movie_id': movie_id, 'score': score, 'algorithm': self.algorithm}
+            for movie_id, score in self.store.top_for_genres(user_id, genre_ids, n_recommendations)
+        ]
@@ -0,0 +1,229 @@
+import numpy as np
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+from scipy.sparse import csr_matrix, diags
+
+from users.models import UserRating
+
+logger = logging.getLogger(__name__)
+
+
+def build_sparse_rating_matrix(chunk_size: int = 50000,
+                               progress_callback: Optional[Callable[[str], None]] = None
+                               ) -> Tuple[Optional[csr_matrix], np.ndarray, np.ndarray]:
+    """
+    流式构建稀疏的用户-电影评分矩阵
+
+    通过values_list逐块读取(user_id, movie_id, rating)元组，
+    不创建模型实例，也不生成稠密矩阵。
+
+    Args:
+        chunk_size: 每次从数据库读取的行数
+        progress_callback: 读取完成、开始构建矩阵时以阶段名'matrix_build'调用
+
+    Returns:
+        (CSR评分矩阵, 有序用户ID数组, 有序电影ID数组)，没有评分数据时矩阵为None
+    """
+    rows = UserRating.objects.values_list('user_id', 'movie_id', 'rating').order_by()
+
+    user_chunks, movie_chunks, rating_chunks = [], [], []
+    buffer = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        buffer.append(row)
+        if len(buffer) >= chunk_size:
+            _flush_chunk(buffer, user_chunks, movie_chunks, rating_chunks)
+            buffer = []
+    if buffer:
+        _flush_chunk(buffer, user_chunks, movie_chunks, rating_chunks)
+
+    if not rating_chunks:
+        logger.warning('没有找到用户评分数据')
+        return None, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    if progress_callback is not None:
+        progress_callback('matrix_build')
+
+    user_col = np.concatenate(user_chunks)
+    movie_col = np.concatenate(movie_chunks)
+    ratings = np.concatenate(rating_chunks)
+
+    # 排序后的唯一ID即矩阵的行/列顺序，inverse即为每条评分的行/列下标
+    user_ids, row_idx = np.unique(user_col, return_inverse=True)
+    movie_ids, col_idx = np.unique(movie_col, return_inverse=True)
+
+    rating_matrix = csr_matrix(
+        (ratings, (row_idx, col_idx)),
+        shape=(len(user_ids), len(movie_ids)),
+        dtype=np.float32
+    )
+
+    return rating_matrix, user_ids, movie_ids
+
+
+def _flush_chunk(buffer: List[Tuple], user_chunks: List, movie_chunks: List, rating_chunks: List):
+    """将一块评分元组转换为numpy数组"""
+    chunk = np.array(buffer, dtype=np.float64)
+    user_chunks.append(chunk[:, 0].astype(np.int64))
+    movie_chunks.append(chunk[:, 1].astype(np.int64))
+    rating_chunks.append(chunk[:, 2].astype(np.float32))
+
+
+class IdIndex:
+    """ID到矩阵下标的映射
+
+    训练时的ID在有序数组上二分查找（数组可以是内存映射，多进程共享），
+    训练后增量追加的ID存放在字典中。
+    """
+
+    def __init__(self, ids: Optional[np.ndarray] = None):
+        """
+        Args:
+            ids: 按矩阵下标排列的ID数组，有序前缀之后的部分（增量追加的ID）放入字典
+        """
+        ids = ids if ids is not None else np.empty(0, dtype=np.int64)
+        breaks = np.flatnonzero(np.diff(ids) <= 0)
+        n_sorted = int(breaks[0]) + 1 if len(breaks) else len(ids)
+
+        self._sorted_ids = ids[:n_sorted]
+        self._appended: Dict[int, int] = {
+            int(id_): n_sorted + offset for offset, id_ in enumerate(ids[n_sorted:])
+        }
+
+    def get(self, id_: int, default: Optional[int] = None) -> Optional[int]:
+        """查找ID对应的下标，不存在时返回default"""
+        idx = self._appended.get(id_)
+        if idx is not None:
+            return idx
+
+        position = int(np.searchsorted(self._sorted_ids, id_))
+        if position < len(self._sorted_ids) and self._sorted_ids[position] == id_:
+            return position
+        return default
+
+    def setdefault(self, id_: int, idx: int) -> int:
+        """ID不存在时追加映射，返回ID对应的下标"""
+        existing = self.get(id_)
+        if existing is not None:
+            return existing
+        self._appended[id_] = idx
+        return idx
+
+    def __contains__(self, id_: int) -> bool:
+        return self.get(id_) is not None
+
+    def __getitem__(self, id_: int) -> int:
+        idx = self.get(id_)
+        if idx is None:
+            raise KeyError(id_)
+        return idx
+
+    def __len__(self) -> int:
+        return len(self._sorted_ids) + len(self._appended)
+
+
+class RatingOverlay:
+    """评分矩阵的行补丁层
+
+    训练后评分有变化的用户的整行评分保存在补丁中，训练时的基础矩阵（可以是多进程共享的
+    内存映射）保持不变；补丁行同时整理为一个小的CSR矩阵，按行读取时与基础矩阵合并。
+    对象不可变，写入时构造新对象整体替换，读取方始终看到完整的补丁。
+    下次训练或导出时补丁合并进矩阵。
+    """
+
+    def __init__(self, shape: Tuple[int, int], patches: Optional[Dict[int, Tuple[np.ndarray, np.ndarray]]] = None):
+        """
+        Args:
+            shape: 合并后矩阵的形状（包含训练后新增的用户和电影）
+            patches: {行下标: (列下标数组（升序）, 评分数组)}
+        """
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.patches = patches or {}
+        self.rows = np.array(sorted(self.patches), dtype=np.int64)
+
+        lengths = np.array([len(self.patches[row][0]) for row in self.rows], dtype=np.int64)
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        if len(self.rows):
+            indices = np.concatenate([self.patches[row][0] for row in self.rows]).astype(np.int32)
+            data = np.concatenate([self.patches[row][1] for row in self.rows]).astype(np.float32)
+        else:
+            indices, data = np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        self.matrix = csr_matrix((data, indices, indptr), shape=(len(self.rows), self.shape[1]))
+
+        squares = np.bincount(
+            np.repeat(np.arange(len(self.rows)), lengths),
+            weights=data.astype(np.float64) ** 2,
+            minlength=len(self.rows)
+        )
+        self.norms = np.sqrt(squares)
+
+    def with_rows(self, rows: Dict[int, Tuple[np.ndarray, np.ndarray]], shape: Tuple[int, int]) -> 'RatingOverlay':
+        """返回替换了若干整行后的新补丁层"""
+        return RatingOverlay(shape, {**self.patches, **rows})
+
+    def lookup(self, user_indices: np.ndarray) -> np.ndarray:
+        """每个行下标在补丁行中的位置，没有补丁的为-1"""
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        if len(self.rows) == 0:
+            return np.full(len(user_indices), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.rows, user_indices), len(self.rows) - 1)
+        return np.where(self.rows[positions] == user_indices, positions, -1)
+
+    def row(self, base: csr_matrix, user_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """一行的(列下标数组, 评分数组)"""
+        patch = self.patches.get(user_idx)
+        if patch is not None:
+            return patch
+        if user_idx >= base.shape[0]:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        start, end = base.indptr[user_idx], base.indptr[user_idx + 1]
+        return base.indices[start:end], base.data[start:end]
+
+    def select_rows(self, base: csr_matrix, user_indices: np.ndarray) -> csr_matrix:
+        """取出若干行（len × 合并后电影数），有补丁的行取补丁，只复制选中的行"""
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        positions = self.lookup(user_indices)
+        from_base = (positions < 0) & (user_indices < base.shape[0])
+
+        selected = base[np.where(from_base, user_indices, 0)]
+        selected = csr_matrix(
+            (selected.data, selected.indices, selected.indptr), shape=(len(user_indices), self.shape[1])
+        )
+        if not from_base.all():
+            selected = (diags(from_base.astype(selected.dtype)) @ selected).tocsr()
+            selected.eliminate_zeros()
+
+        patched = np.flatnonzero(positions >= 0)
+        if len(patched):
+            picker = csr_matrix(
+                (np.ones(len(patched), dtype=selected.dtype), (patched, positions[patched])),
+                shape=(len(user_indices), len(self.rows))
+            )
+            selected = (selected + picker @ self.matrix).tocsr()
+            selected.sort_indices()
+        return selected
+
+    def dot(self, base: csr_matrix, vector: csr_matrix) -> np.ndarray:
+        """所有行（合并后）与一个行向量（1 × 合并后电影数）的内积"""
+        column = vector.T.astype(np.float64)
+        dots = np.zeros(self.shape[0])
+        dots[:base.shape[0]] = (base @ column[:base.shape[1]]).toarray().ravel()
+        if len(self.rows):
+            dots[self.rows] = (self.matrix @ column).toarray().ravel()
+        return dots
+
+    def norms_for(self, base_norms: np.ndarray, user_indices: np.ndarray) -> np.ndarray:
+        """若干行的L2范数，有补丁的行取补丁的范数"""
+        user_indices = np.asarray(user_indices, dtype=np.int64)
+        norms = np.zeros(len(user_indices))
+        in_base = user_indices < len(base_norms)
+        norms[in_base] = base_norms[user_indices[in_base]]
+        positions = self.lookup(user_indices)
+        patched = positions >= 0
+        norms[patched] = self.norms[positions[patched]]
+        return norms
+
+    def merged(self, base: csr_matrix) -> csr_matrix:
+        """补丁合并进基础矩阵后的完整矩阵（新数组，不修改基础矩阵）"""
+        if not self.patches and base.shape == self.shape:
+            return base
+        return self.select_rows(base, np.arange(self.shape[0]))
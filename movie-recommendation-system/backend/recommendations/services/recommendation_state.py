@@ -0,0 +1,84 @@
+from typing import Dict, Iterable, List, Optional
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from users.models import UserRating
+from recommendations.models import Recommendation, UserRecommendationState
+
+
+def ratings_watermark(user_id: int) -> Dict:
+    """用户评分的水位线：评分数量与最近更新时间，评分新增、修改、删除都会使其变化"""
+    return UserRating.objects.filter(user_id=user_id).aggregate(count=Count('id'), latest=Max('updated_at'))
+
+
+def ratings_watermarks(user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict]:
+    """一次查询获取多个用户（默认为所有有评分的用户）的评分水位线，没有评分的用户为空水位线"""
+    ratings = UserRating.objects.all()
+    watermarks = {}
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        ratings = ratings.filter(user_id__in=user_ids)
+        watermarks = {user_id: {'count': 0, 'latest': None} for user_id in user_ids}
+
+    rows = (
+        ratings
+        .values('user_id')
+        .annotate(count=Count('id'), latest=Max('updated_at'))
+        .order_by()
+    )
+    for row in rows:
+        watermarks[row['user_id']] = {'count': row['count'], 'latest': row['latest']}
+    return watermarks
+
+
+def get_fresh_recommendations(user_id: int, algorithm: str, parameters: Dict,
+                              watermark: Dict) -> Optional[List[Dict]]:
+    """
+    用户评分与参数自上次生成以来都没有变化时返回已保存的推荐，否则返回None
+
+    Returns:
+        与推荐器输出格式相同的推荐列表（按分数降序）
+    """
+    state = UserRecommendationState.objects.filter(user_id=user_id, algorithm=algorithm).first()
+    if state is None or state.parameters != parameters:
+        return None
+    if state.ratings_count != watermark['count'] or state.ratings_updated_at != watermark['latest']:
+        return None
+
+    return list(
+        Recommendation.objects.filter(user_id=user_id, algorithm=algorithm)
+        .order_by('-score', 'id')
+        .values('movie_id', 'score', 'algorithm')
+    )
+
+
+def mark_generated(watermarks: Dict[int, Dict], algorithm: str, parameters: Dict):
+    """
+    记录推荐结果生成时的评分水位线与参数
+
+    水位线应在生成推荐之前读取，生成期间发生的评分变化会使下次刷新重新计算。
+    """
+    user_ids = list(watermarks)
+    existing = {
+        state.user_id: state
+        for state in UserRecommendationState.objects.filter(user_id__in=user_ids, algorithm=algorithm)
+    }
+
+    now = timezone.now()
+    to_create, to_update = [], []
+    for user_id, watermark in watermarks.items():
+        state = existing.get(user_id)
+        if state is None:
+            state = UserRecommendationState(user_id=user_id, algorithm=algorithm)
+            to_create.append(state)
+        else:
+            to_update.append(state)
+        state.parameters = parameters
+        state.ratings_count = watermark['count']
+        state.ratings_updated_at = watermark['latest']
+        state.generated_at = now
+
+    UserRecommendationState.objects.bulk_create(to_create, batch_size=1000)
+    UserRecommendationState.objects.bulk_update(
+        to_update, ['parameters', 'ratings_count', 'ratings_updated_at', 'generated_at'], batch_size=1000
+    )
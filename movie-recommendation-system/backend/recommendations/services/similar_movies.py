@@ -0,0 +1,116 @@
+import numpy as np
+import logging
+from typing import Dict, List, Optional, Tuple
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from movies.models import Movie, SimilarMovie
+from recommendations.services.content_features import ContentFeatures
+from recommendations.services.similarity import cosine_topk
+
+logger = logging.getLogger(__name__)
+
+
+def compute_similar_movies(features: ContentFeatures, movie_indices: np.ndarray, k: int = 20,
+                           min_similarity: float = 0.1,
+                           n_jobs: Optional[int] = None) -> Dict[int, List[Tuple[int, float]]]:
+    """
+    计算一批电影在全部电影中的前K个相似电影（基于内容特征的余弦相似度）
+
+    Args:
+        features: 电影内容特征
+        movie_indices: 需要计算的电影在特征矩阵中的行下标
+        k: 每部电影保留的相似电影数量
+        min_similarity: 最小相似度阈值（不包含）
+        n_jobs: 相似度计算的线程数
+
+    Returns:
+        {电影ID: [(相似电影ID, 相似度), ...]}，按相似度降序排列
+    """
+    # 多取一个以便排除电影自身
+    indptr, indices, similarities = cosine_topk(
+        features.matrix[movie_indices],
+        features.matrix,
+        k=k + 1,
+        min_similarity=min_similarity,
+        n_jobs=n_jobs,
+        normalized=True
+    )
+
+    similar = {}
+    for row, movie_idx in enumerate(movie_indices):
+        start, end = indptr[row], indptr[row + 1]
+        similar[int(features.movie_ids[movie_idx])] = [
+            (int(features.movie_ids[idx]), float(similarity))
+            for idx, similarity in zip(indices[start:end], similarities[start:end])
+            if idx != movie_idx and similarity > min_similarity
+        ][:k]
+
+    return similar
+
+
+def save_similar_movies(similar: Dict[int, List[Tuple[int, float]]]) -> int:
+    """
+    在一个事务中替换一批电影的相似电影，并记录这些电影的计算时间，返回写入的条数
+
+    没有相似电影的电影同样记录计算时间，增量计算时不会再被当作新电影。
+    """
+    rows = [
+        SimilarMovie(movie_id=movie_id, similar_movie_id=similar_id, score=score, rank=rank)
+        for movie_id, items in similar.items()
+        for rank, (similar_id, score) in enumerate(items, start=1)
+    ]
+
+    with transaction.atomic():
+        SimilarMovie.objects.filter(movie_id__in=list(similar)).delete()
+        SimilarMovie.objects.bulk_create(rows, batch_size=1000)
+        # 用update记录计算时间，不触发电影变化信号
+        Movie.objects.filter(id__in=list(similar)).update(similar_computed_at=timezone.now())
+
+    return len(rows)
+
+
+def find_affected_movies(features: ContentFeatures, new_indices: np.ndarray, k: int = 20,
+                         min_similarity: float = 0.1, n_jobs: Optional[int] = None) -> np.ndarray:
+    """
+    找出相似电影列表会因新增电影而改变的已有电影
+
+    已有电影与新电影的最高相似度超过其列表中最低分（或列表未满K个）时需要重算。
+
+    Returns:
+        需要重算的已有电影行下标
+    """
+    stored = {
+        row['movie_id']: (row['lowest'], row['count'])
+        for row in SimilarMovie.objects.values('movie_id').annotate(lowest=Min('score'), count=Count('id')).order_by()
+    }
+
+    new_set = set(new_indices.tolist())
+    existing = np.array(
+        [idx for idx in range(len(features.movie_ids)) if idx not in new_set],
+        dtype=np.int64
+    )
+    if len(existing) == 0 or len(new_indices) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    # 每部已有电影与新电影的最高相似度
+    indptr, _, similarities = cosine_topk(
+        features.matrix[existing],
+        features.matrix[new_indices],
+        k=1,
+        min_similarity=min_similarity,
+        n_jobs=n_jobs,
+        normalized=True
+    )
+
+    affected = []
+    for row, movie_idx in enumerate(existing):
+        if indptr[row] == indptr[row + 1]:
+            continue
+        best = similarities[indptr[row]]
+        lowest, count = stored.get(int(features.movie_ids[movie_idx]), (None, 0))
+        if best > min_similarity and (count < k or best > lowest):
+            affected.append(movie_idx)
+
+    return np.array(affected, dtype=np.int64)
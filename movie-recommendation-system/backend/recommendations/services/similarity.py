@@ -0,0 +1,103 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Union
+from django.conf import settings
+from scipy.sparse import csr_matrix, issparse
+
+Matrix = Union[np.ndarray, csr_matrix]
+
+
+def normalize_rows(matrix: Matrix) -> Matrix:
+    """按行L2归一化（零向量保持为零），归一化后行内积即为余弦相似度"""
+    if issparse(matrix):
+        matrix = csr_matrix(matrix, dtype=np.float64)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        return csr_matrix(matrix.multiply(inverse[:, None]))
+
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1)
+    inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return matrix * inverse[:, None]
+
+
+def cosine_topk(queries: Matrix, candidates: Optional[Matrix] = None, k: int = 20,
+                min_similarity: float = 0.0, exclude_self: bool = False,
+                memory_budget_mb: Optional[int] = None, n_jobs: Optional[int] = None,
+                normalized: bool = False) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    分块、多线程计算余弦相似度，只保留每个查询行的前K个结果
+
+    按内存预算切分查询行，每块与全部候选行做一次矩阵乘法后用argpartition取前K，
+    峰值内存由预算决定，与完整相似度矩阵无关。NumPy/SciPy的矩阵乘法会释放GIL，
+    多个块在线程池中并行，预算由同时计算的各块平分。
+
+    Args:
+        queries: 查询矩阵（稠密或稀疏），每行一个向量
+        candidates: 候选矩阵，为None时与queries相同
+        k: 每行保留的结果数量
+        min_similarity: 最小相似度阈值（包含）
+        exclude_self: candidates为None时是否排除自身（对角线）
+        memory_budget_mb: 相似度计算的内存预算（MB），默认取RECOMMENDATION_SIMILARITY_MEMORY_MB
+        n_jobs: 线程数，默认取RECOMMENDATION_SIMILARITY_WORKERS
+        normalized: 输入是否已按行L2归一化
+
+    Returns:
+        (indptr, indices, similarities)，CSR形式，每行结果按相似度降序排列
+    """
+    self_similarity = candidates is None
+    if not normalized:
+        queries = normalize_rows(queries)
+        candidates = queries if self_similarity else normalize_rows(candidates)
+    elif self_similarity:
+        candidates = queries
+
+    n_queries, n_candidates = queries.shape[0], candidates.shape[0]
+    k = min(k, n_candidates - (1 if self_similarity and exclude_self else 0))
+    if k <= 0 or n_queries == 0:
+        return np.zeros(n_queries + 1, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+    n_jobs = n_jobs or getattr(settings, 'RECOMMENDATION_SIMILARITY_WORKERS', None) or min(4, os.cpu_count() or 1)
+    block_size = _block_size(n_candidates, memory_budget_mb, n_jobs)
+    candidates_t = candidates.T.tocsr() if issparse(candidates) else candidates.T
+
+    def process_block(start: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        end = min(start + block_size, n_queries)
+        block = queries[start:end] @ candidates_t
+        block = block.toarray() if issparse(block) else np.asarray(block)
+
+        if self_similarity and exclude_self:
+            block[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_similarities = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_similarities, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_similarities = np.take_along_axis(top_similarities, order, axis=1)
+
+        # 已按降序排列，满足阈值的结果都在每行前部
+        valid = top_similarities >= min_similarity
+        return valid.sum(axis=1), top[valid].astype(np.int32), top_similarities[valid].astype(np.float32)
+
+    starts = range(0, n_queries, block_size)
+
+    if n_jobs > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(process_block, starts))
+    else:
+        results = [process_block(start) for start in starts]
+
+    indptr = np.zeros(n_queries + 1, dtype=np.int64)
+    np.cumsum(np.concatenate([counts for counts, _, _ in results]), out=indptr[1:])
+    indices = np.concatenate([block_indices for _, block_indices, _ in results])
+    similarities = np.concatenate([block_similarities for _, _, block_similarities in results])
+
+    return indptr, indices, similarities
+
+
+def _block_size(n_candidates: int, memory_budget_mb: Optional[int], n_jobs: int) -> int:
+    """根据内存预算计算每块的查询行数（相似度块与argpartition临时数组各占8字节/元素）"""
+    memory_budget_mb = memory_budget_mb or getattr(settings, 'RECOMMENDATION_SIMILARITY_MEMORY_MB', 256)
+    bytes_per_row = max(n_candidates, 1) * 16 * max(n_jobs, 1)
+    return max(1, int(memory_budget_mb * 1024 * 1024 // bytes_per_row))
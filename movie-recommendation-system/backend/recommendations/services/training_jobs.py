@@ -0,0 +1,155 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from recommendations.models import TrainingJob
+from recommendations.services.model_registry import model_registry
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_training(algorithm: str, parameters: Dict, user=None) -> Tuple[TrainingJob, bool]:
+    """
+    提交训练任务，相同参数的任务仍在排队时直接返回该任务
+
+    Returns:
+        (训练任务, 是否新建)
+    """
+    pending = TrainingJob.objects.filter(
+        algorithm=algorithm, parameters=parameters, status='pending'
+    ).order_by('created_at').first()
+    if pending is not None:
+        return pending, False
+
+    job = TrainingJob.objects.create(algorithm=algorithm, parameters=parameters, requested_by=user)
+    return job, True
+
+
+def claim_next_job() -> Optional[TrainingJob]:
+    """
+    领取最早的排队任务，领取前先回收工作进程已中断的任务
+
+    用条件更新（status仍为pending时才改为running）领取，
+    多个工作进程同时轮询时每个任务只会被一个进程领取，不依赖数据库的行锁支持。
+    """
+    recover_stale_jobs()
+
+    while True:
+        job = TrainingJob.objects.filter(status='pending').order_by('created_at').first()
+        if job is None:
+            return None
+
+        started_at = timezone.now()
+        claimed = TrainingJob.objects.filter(id=job.id, status='pending').update(
+            status='running', started_at=started_at, heartbeat_at=started_at, attempts=F('attempts') + 1
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def recover_stale_jobs() -> int:
+    """
+    回收心跳超时的训练任务（工作进程崩溃或被终止时任务会一直停留在running）
+
+    执行次数未达到RECOMMENDATION_TRAINING_MAX_ATTEMPTS的任务重新排队，否则标记为失败。
+    用条件更新（心跳仍早于超时时间时才修改），多个工作进程同时回收时不会重复处理。
+
+    Returns:
+        回收的任务数量
+    """
+    timeout = getattr(settings, 'RECOMMENDATION_TRAINING_HEARTBEAT_TIMEOUT', 300)
+    max_attempts = getattr(settings, 'RECOMMENDATION_TRAINING_MAX_ATTEMPTS', 2)
+    now = timezone.now()
+    stale = TrainingJob.objects.filter(status='running', heartbeat_at__lt=now - timedelta(seconds=timeout))
+
+    requeued = stale.filter(attempts__lt=max_attempts).update(
+        status='pending', stage='', stages=[], heartbeat_at=None
+    )
+    failed = stale.filter(attempts__gte=max_attempts).update(
+        status='failed', error='训练工作进程中断，超过最大执行次数', finished_at=now
+    )
+    if requeued or failed:
+        logger.warning(f'回收心跳超时的训练任务：重新排队{requeued}个，标记失败{failed}个')
+    return requeued + failed
+
+
+def run_training_job(job: TrainingJob) -> bool:
+    """执行训练任务，逐阶段记录耗时，完成后记录导出的模型版本；执行期间在后台线程中定期更新心跳"""
+
+    def record_stage(stage: str):
+        now = timezone.now()
+        _close_stage(job, now)
+        job.stage = stage
+        job.stages.append({'stage': stage, 'started_at': now.isoformat(), 'duration': None})
+        job.save(update_fields=['stage', 'stages'])
+
+    stop_heartbeat = _start_heartbeat(job)
+    try:
+        recommender = model_registry.get_model(
+            k_neighbors=job.parameters.get('k_neighbors', 20),
+            min_similarity=job.parameters.get('min_similarity', 0.1),
+            algorithm=job.algorithm,
+            force_retrain=True,
+            progress_callback=record_stage
+        )
+    except Exception as e:
+        logger.error(f'训练任务#{job.id}执行出错: {e}')
+        recommender = None
+        job.error = str(e)
+    finally:
+        stop_heartbeat()
+
+    job.finished_at = timezone.now()
+    _close_stage(job, job.finished_at)
+
+    if recommender is not None:
+        job.status = 'succeeded'
+        job.model_version = recommender.version
+    else:
+        job.status = 'failed'
+        job.error = job.error or '模型训练失败'
+
+    job.save(update_fields=['status', 'stages', 'model_version', 'error', 'finished_at'])
+    return job.status == 'succeeded'
+
+
+def _start_heartbeat(job: TrainingJob):
+    """
+    启动心跳线程，每隔心跳超时的五分之一更新一次heartbeat_at
+
+    Returns:
+        停止心跳的函数
+    """
+    interval = getattr(settings, 'RECOMMENDATION_TRAINING_HEARTBEAT_TIMEOUT', 300) / 5
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(interval):
+                TrainingJob.objects.filter(id=job.id, status='running').update(heartbeat_at=timezone.now())
+        except Exception as e:
+            logger.error(f'训练任务#{job.id}心跳更新失败: {e}')
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f'training-heartbeat-{job.id}', daemon=True)
+    thread.start()
+
+    def stop():
+        stopped.set()
+        thread.join()
+
+    return stop
+
+
+def _close_stage(job: TrainingJob, now):
+    """记录上一阶段的耗时（秒）"""
+    if job.stages and job.stages[-1]['duration'] is None:
+        started_at = datetime.fromisoformat(job.stages[-1]['started_at'])
+        job.stages[-1]['duration'] = round((now - started_at).total_seconds(), 3)
@@ -0,0 +1,103 @@
+import logging
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from movies.models import Movie, Genre
+from users.models import CustomUser, UserRating, UserWatchlist, UserInteraction
+from recommendations.models import DirtyUser
+from recommendations.services.dirty_users import mark_dirty
+from recommendations.services.model_registry import model_registry
+from recommendations.services.content_features import content_feature_store
+from recommendations.services.popularity import popularity_store
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=UserRating)
+def sync_rating_saved(sender, instance, created, **kwargs):
+    """评分新增或修改后，增量更新共享的KNN模型"""
+    user_id, movie_id, rating = instance.user_id, instance.movie_id, instance.rating
+
+    def apply():
+        try:
+            model_registry.apply_rating_update(user_id, movie_id, rating, created)
+        except Exception as e:
+            logger.error(f'增量更新KNN模型失败: {e}')
+
+    transaction.on_commit(apply)
+    _mark_user_dirty(user_id, DirtyUser.PRIORITY_RATINGS, ratings_changed=True)
+
+
+@receiver(post_delete, sender=UserRating)
+def sync_rating_deleted(sender, instance, **kwargs):
+    """评分删除后，增量更新共享的KNN模型"""
+    user_id, movie_id = instance.user_id, instance.movie_id
+
+    def apply():
+        try:
+            model_registry.apply_rating_removal(user_id, movie_id)
+        except Exception as e:
+            logger.error(f'增量更新KNN模型失败: {e}')
+
+    transaction.on_commit(apply)
+    if not _deleting_user(kwargs.get('origin')):
+        _mark_user_dirty(user_id, DirtyUser.PRIORITY_RATINGS, ratings_changed=True)
+
+
+@receiver(post_save, sender=UserWatchlist)
+@receiver(post_delete, sender=UserWatchlist)
+def mark_dirty_on_watchlist(sender, instance, **kwargs):
+    """待看列表变化后，标记用户的推荐需要重新计算"""
+    if not _deleting_user(kwargs.get('origin')):
+        _mark_user_dirty(instance.user_id, DirtyUser.PRIORITY_WATCHLIST)
+
+
+@receiver(post_save, sender=UserInteraction)
+def mark_dirty_on_interaction(sender, instance, created, **kwargs):
+    """记录新的交互后，标记用户的推荐需要重新计算"""
+    if created:
+        _mark_user_dirty(instance.user_id, DirtyUser.PRIORITY_INTERACTION)
+
+
+def _deleting_user(origin) -> bool:
+    """删除是否由删除用户级联引起，此时不需要再标记该用户"""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, CustomUser)
+
+
+def _mark_user_dirty(user_id: int, priority: int, ratings_changed: bool = False):
+    """提交后标记用户待更新，邻居用户在重新计算时按邻居图扩散标记"""
+    def apply():
+        try:
+            mark_dirty([user_id], priority, ratings_changed=ratings_changed)
+        except Exception as e:
+            logger.error(f'标记待更新推荐用户失败: {e}')
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def invalidate_content_features(sender, **kwargs):
+    """电影或类型变化后，使缓存的电影内容特征失效"""
+    content_feature_store.invalidate()
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+@receiver(post_delete, sender=Genre)
+def invalidate_popularity_ranking(sender, **kwargs):
+    """电影新增、修改或删除，或类型删除后，使缓存的热门电影榜单与类型榜单失效"""
+    popularity_store.invalidate()
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def invalidate_content_features_on_genres(sender, action, **kwargs):
+    """电影类型关联变化后，使缓存的电影内容特征与热门类型榜单失效"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        content_feature_store.invalidate()
+        popularity_store.invalidate()
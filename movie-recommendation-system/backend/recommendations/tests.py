@@ -0,0 +1,125 @@
+import time
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from unittest import mock
+from django.test import TestCase, TransactionTestCase
+
+from movies.models import Movie
+from users.models import CustomUser, UserRating
+from recommendations.models import TrainingJob
+from recommendations.services.knn_recommender import KNNRecommender, _new_version
+from recommendations.services.model_registry import ModelRegistry, model_registry
+from recommendations.services.hybrid_recommender import HybridRecommender
+from recommendations.services.popularity import PopularityStore
+
+
+class HybridRecommenderTests(TransactionTestCase):
+    """混合推荐器测试（候选来源在线程池中访问数据库，使用TransactionTestCase）"""
+
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp(prefix='hybrid-tests-')
+        self.addCleanup(shutil.rmtree, self.model_dir, ignore_errors=True)
+        patcher = mock.patch.object(model_registry, 'model_dir', self.model_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        model_registry.invalidate()
+        self.addCleanup(model_registry.invalidate)
+
+        movies = [
+            Movie.objects.create(tmdb_id=i, title=f'电影{i}', vote_average=6.0 + i / 10, vote_count=100 + i)
+            for i in range(1, 11)
+        ]
+        self.user = CustomUser.objects.create_user(username='viewer', email='viewer@example.com', password='password')
+        for movie in movies[:3]:
+            UserRating.objects.create(user=self.user, movie=movie, rating=4.0)
+
+    def test_slow_training_does_not_block_budget(self):
+        """没有就绪的模型时不在请求中训练：在延迟预算内返回，跳过协同过滤并提交训练任务"""
+
+        def slow_fit(recommender, progress_callback=None):
+            time.sleep(3)
+            return False
+
+        hybrid = HybridRecommender({'timeout': 0.5})
+        with mock.patch.object(KNNRecommender, 'fit', slow_fit):
+            started = time.monotonic()
+            recommendations = hybrid.recommend_for_user(self.user.id, 5)
+            elapsed = time.monotonic() - started
+
+        self.assertLess(elapsed, 1.5)
+        self.assertIn('collaborative', hybrid.skipped_sources)
+        self.assertTrue(recommendations)
+        self.assertTrue(TrainingJob.objects.filter(
+            algorithm=KNNRecommender.algorithm, status='pending'
+        ).exists())
+
+
+class ModelVersionTests(TestCase):
+    """模型版本排序与回滚测试"""
+
+    def setUp(self):
+        self.model_dir = tempfile.mkdtemp(prefix='registry-tests-')
+        self.addCleanup(shutil.rmtree, self.model_dir, ignore_errors=True)
+        self.registry = ModelRegistry(model_dir=self.model_dir)
+
+        movies = [Movie.objects.create(tmdb_id=i, title=f'电影{i}') for i in range(1, 7)]
+        for u in range(4):
+            user = CustomUser.objects.create_user(username=f'user{u}', email=f'user{u}@example.com', password='password')
+            for movie in movies[u:u + 3]:
+                UserRating.objects.create(user=user, movie=movie, rating=3.0 + u / 2)
+
+    def _export(self, version=None):
+        """训练并导出一个版本，返回版本号"""
+        recommender = KNNRecommender(k_neighbors=2, min_similarity=0.0)
+        self.assertTrue(recommender.fit())
+        if version is not None:
+            recommender.version = version
+        key = self.registry.make_key(recommender.k_neighbors, recommender.min_similarity, recommender.algorithm)
+        self.assertTrue(self.registry._export_artifact(key, recommender, self.registry._data_snapshot()))
+        return key, recommender.version
+
+    def test_versions_in_same_second_are_ordered(self):
+        """同一秒内训练的版本号严格递增，回滚到之前导出的版本"""
+        trained_at = datetime.now(timezone.utc)
+        self.assertLess(_new_version(trained_at), _new_version(trained_at))
+
+        key, first = self._export()
+        _, second = self._export()
+
+        self.assertLess(first, second)
+        self.assertEqual([m['version'] for m in self.registry.list_versions(key)], [second, first])
+        self.assertEqual(self.registry.rollback(key).version, first)
+
+    def test_rollback_orders_by_export_time(self):
+        """旧格式版本号（随机后缀）按导出时间而不是名称排序"""
+        key, first = self._export('20260101120000-ffffff')
+        _, second = self._export('20260101120000-000000')
+
+        self.assertEqual(self.registry.current_version(key), (second, False))
+        self.assertEqual(self.registry.list_versions(key)[0]['version'], second)
+        self.assertEqual(self.registry.rollback(key).version, first)
+
+
+class PopularityStoreTests(TestCase):
+    """热门电影榜单缓存测试"""
+
+    def setUp(self):
+        for i in range(1, 6):
+            Movie.objects.create(tmdb_id=i, title=f'电影{i}', vote_average=5.0 + i, vote_count=100)
+        self.user = CustomUser.objects.create_user(username='viewer', email='viewer@example.com', password='password')
+
+    def test_invalidated_during_build_still_returns_ranking(self):
+        """构建期间榜单被失效时本次调用仍返回新构建的榜单，下次调用重新构建"""
+        store = PopularityStore()
+        build = store._build
+
+        def build_and_invalidate():
+            ranking = build()
+            store.invalidate()
+            return ranking
+
+        with mock.patch.object(store, '_build', side_effect=build_and_invalidate):
+            self.assertIsNotNone(store.get())
+        self.assertIsNone(store._ranking)
+        self.assertEqual(len(store.top_for_user(self.user.id, 3)), 3)
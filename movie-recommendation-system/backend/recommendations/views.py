@@ -3,17 +3,25 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
+from django.conf import settings
 from django.db.models import Q
 import logging
 
-from .models import Recommendation, RecommendationConfig
+from .models import Recommendation, RecommendationConfig, TrainingJob
 from .serializers import (
     RecommendationSerializer,
     RecommendationConfigSerializer,
-    KNNRecommendationSerializer
+    KNNRecommendationSerializer,
+    ModelVersionSerializer,
+    TrainingJobSerializer
 )
 from .services.knn_recommender import KNNRecommender
-from movies.models import Movie
+from .services.hybrid_recommender import HybridRecommender
+from .services.popularity import PopularityRecommender, ColdStartRecommender
+from .services.model_registry import model_registry, RECOMMENDER_CLASSES
+from .services.training_jobs import enqueue_training
+from .services.recommendation_state import ratings_watermark, get_fresh_recommendations, mark_generated
+from movies.models import Movie, SimilarMovie
 from users.models import CustomUser
 
 logger = logging.getLogger(__name__)
@@ -30,8 +38,15 @@ class RecommendationViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def refresh(self, request):
-        """刷新用户推荐"""
+        """
+        刷新用户推荐
+
+        评分太少的用户直接从偏好类型的预计算榜单中推荐，不获取或训练任何模型；
+        用户评分与配置参数自上次生成以来都没有变化时直接返回已保存的推荐，
+        传入force=true时强制重新计算。
+        """
         user = request.user
+        force = request.query_params.get('force', '').lower() in ('1', 'true', 'yes')
 
         # 获取活跃的推荐配置
         active_configs = RecommendationConfig.objects.filter(is_active=True)
@@ -43,25 +58,53 @@ class RecommendationViewSet(viewsets.ModelViewSet):
             )
 
         recommendations = []
+        cached_algorithms = []
+        n_recommendations = max(config.parameters.get('n_recommendations', 10) for config in active_configs)
+
+        # 生成推荐之前读取评分水位线，生成期间的评分变化会使下次刷新重新计算
+        watermark = ratings_watermark(user.id)
+
+        if watermark['count'] < getattr(settings, 'RECOMMENDATION_COLD_START_MIN_RATINGS', 1):
+            # 冷启动：合并偏好类型的预计算榜单，评分太少时协同过滤模型没有可用的结果
+            recommender = ColdStartRecommender()
+            recommendations = recommender.recommend_for_user(user.id, n_recommendations=n_recommendations)
+            recommender.save_recommendations(user.id, recommendations)
+
+            return Response({
+                'message': f'已生成{len(recommendations)}条推荐',
+                'recommendations': recommendations,
+                'cached_algorithms': cached_algorithms
+            })
+
+        # 用户已有足够评分，清除冷启动时保存的推荐
+        Recommendation.objects.filter(user=user, algorithm=ColdStartRecommender.algorithm).delete()
 
         for config in active_configs:
-            if config.algorithm == 'knn_collaborative_filtering':
-                # 使用KNN协同过滤
-                recommender = KNNRecommender(
+            if not force:
+                stored = get_fresh_recommendations(user.id, config.algorithm, config.parameters, watermark)
+                if stored is not None:
+                    recommendations.extend(stored)
+                    cached_algorithms.append(config.algorithm)
+                    continue
+
+            if config.algorithm in RECOMMENDER_CLASSES:
+                # 使用用户/物品KNN协同过滤（从注册表获取已训练模型）
+                recommender = model_registry.get_model(
                     k_neighbors=config.parameters.get('k_neighbors', 20),
-                    min_similarity=config.parameters.get('min_similarity', 0.1)
+                    min_similarity=config.parameters.get('min_similarity', 0.1),
+                    algorithm=config.algorithm
                 )
 
-                # 训练模型
-                if recommender.fit():
+                if recommender is not None:
                     # 生成推荐
                     user_recommendations = recommender.recommend_for_user(
                         user.id,
                         n_recommendations=config.parameters.get('n_recommendations', 10)
                     )
 
-                    # 保存推荐结果
-                    recommender.save_recommendations(user.id, user_recommendations)
+                    # 保存推荐结果，结果为空或保存失败时不记录生成状态，下次刷新重新计算
+                    if recommender.save_recommendations(user.id, user_recommendations):
+                        mark_generated({user.id: watermark}, config.algorithm, config.parameters)
 
                     recommendations.extend(user_recommendations)
 
@@ -80,14 +123,50 @@ class RecommendationViewSet(viewsets.ModelViewSet):
                         n_recommendations=config.parameters.get('n_recommendations', 10)
                     )
 
-                    # 保存推荐结果
-                    recommender.save_recommendations(user.id, movie_recommendations)
+                    # 保存推荐结果，结果为空或保存失败时不记录生成状态，下次刷新重新计算
+                    saved = recommender.save_recommendations(
+                        user.id, movie_recommendations, algorithm=config.algorithm
+                    )
+                    if saved:
+                        mark_generated({user.id: watermark}, config.algorithm, config.parameters)
 
                     recommendations.extend(movie_recommendations)
 
+            elif config.algorithm == HybridRecommender.algorithm:
+                # 混合推荐：各候选来源并发运行，在延迟预算内融合已返回的结果
+                recommender = HybridRecommender(config.parameters)
+                hybrid_recommendations = recommender.recommend_for_user(user.id)
+
+                saved = recommender.save_recommendations(user.id, hybrid_recommendations)
+                # 有来源超时、结果为空或保存失败时不记录生成状态，下次刷新重新计算
+                if saved and not recommender.skipped_sources:
+                    mark_generated({user.id: watermark}, config.algorithm, config.parameters)
+
+                recommendations.extend(hybrid_recommendations)
+
+            elif config.algorithm == PopularityRecommender.algorithm:
+                # 热门推荐：从预计算榜单中排除已评分电影（一次查询）
+                recommender = PopularityRecommender()
+                popular_recommendations = recommender.recommend_for_user(
+                    user.id,
+                    n_recommendations=config.parameters.get('n_recommendations', 10)
+                )
+
+                if recommender.save_recommendations(user.id, popular_recommendations):
+                    mark_generated({user.id: watermark}, config.algorithm, config.parameters)
+
+                recommendations.extend(popular_recommendations)
+
+        if not recommendations:
+            # 其他算法都没有结果（如模型尚未训练）时兜底返回热门推荐
+            recommender = PopularityRecommender()
+            recommendations = recommender.recommend_for_user(user.id, n_recommendations=n_recommendations)
+            recommender.save_recommendations(user.id, recommendations)
+
         return Response({
             'message': f'已生成{len(recommendations)}条推荐',
-            'recommendations': recommendations
+            'recommendations': recommendations,
+            'cached_algorithms': cached_algorithms
         })
 
     @action(detail=False, methods=['get'])
@@ -109,25 +188,34 @@ class RecommendationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        # 使用KNN内容推荐
-        recommender = KNNRecommender()
-        recommendations = recommender.recommend_based_on_movie(movie.id)
+        # 优先读取预计算的相似电影表，尚未计算的电影（如新同步的电影）实时计算
+        similar_entries = list(
+            SimilarMovie.objects.filter(movie=movie).select_related('similar_movie')[:10]
+        )
+        if similar_entries:
+            scored_movies = [(entry.similar_movie, entry.score) for entry in similar_entries]
+        else:
+            recommender = KNNRecommender()
+            recommendations = recommender.recommend_based_on_movie(movie.id)
+            movies_by_id = Movie.objects.in_bulk([rec['movie_id'] for rec in recommendations])
+            scored_movies = [
+                (movies_by_id[rec['movie_id']], rec['score'])
+                for rec in recommendations
+                if rec['movie_id'] in movies_by_id
+            ]
 
         # 获取电影详情
-        movie_details = []
-        for rec in recommendations:
-            try:
-                rec_movie = Movie.objects.get(id=rec['movie_id'])
-                movie_details.append({
-                    'id': rec_movie.id,
-                    'title': rec_movie.title,
-                    'poster_url': rec_movie.get_poster_url(),
-                    'score': rec['score'],
-                    'vote_average': rec_movie.vote_average,
-                    'release_date': rec_movie.release_date
-                })
-            except Movie.DoesNotExist:
-                continue
+        movie_details = [
+            {
+                'id': rec_movie.id,
+                'title': rec_movie.title,
+                'poster_url': rec_movie.get_poster_url(),
+                'score': score,
+                'vote_average': rec_movie.vote_average,
+                'release_date': rec_movie.release_date
+            }
+            for rec_movie, score in scored_movies
+        ]
 
         return Response({
             'movie': {
@@ -168,40 +256,98 @@ class KNNRecommendationView(viewsets.ViewSet):
     """KNN推荐API视图"""
     permission_classes = [IsAuthenticated]
 
+    def get_permissions(self):
+        """只有管理员可以回滚模型版本"""
+        if self.action == 'rollback':
+            from rest_framework.permissions import IsAdminUser
+            return [IsAdminUser()]
+        return super().get_permissions()
+
     @action(detail=False, methods=['post'])
     def train(self, request):
-        """训练KNN模型"""
+        """提交KNN模型训练任务，由后台训练工作进程执行"""
         serializer = KNNRecommendationSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         data = serializer.validated_data
 
-        # 创建推荐器
-        recommender = KNNRecommender(
-            k_neighbors=data.get('k_neighbors', 20),
-            min_similarity=data.get('min_similarity', 0.1)
+        # 训练在run_training_worker进程中执行，不占用Web工作进程
+        job, created = enqueue_training(
+            algorithm=data['algorithm'],
+            parameters={
+                'k_neighbors': data['k_neighbors'],
+                'min_similarity': data['min_similarity']
+            },
+            user=request.user
         )
 
-        # 训练模型
-        success = recommender.fit()
+        return Response({
+            'message': 'KNN模型训练任务已提交' if created else '相同参数的训练任务已在排队',
+            'job_id': job.id,
+            'status': job.status
+        }, status=status.HTTP_202_ACCEPTED)
 
-        if success:
-            return Response({
-                'message': 'KNN模型训练成功',
-                'parameters': {
-                    'k_neighbors': recommender.k_neighbors,
-                    'min_similarity': recommender.min_similarity,
-                    'user_count': len(recommender.user_ids) if recommender.user_ids else 0,
-                    'movie_count': len(recommender.movie_ids) if recommender.movie_ids else 0
-                }
-            })
-        else:
+    @action(detail=False, methods=['get'])
+    def train_status(self, request):
+        """查询训练任务的状态、各阶段耗时与生成的模型版本"""
+        job_id = request.query_params.get('job_id')
+
+        if not job_id:
             return Response(
-                {'error': 'KNN模型训练失败'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'error': '需要提供job_id参数'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            job = TrainingJob.objects.get(id=int(job_id))
+        except (ValueError, TrainingJob.DoesNotExist):
+            return Response(
+                {'error': '训练任务不存在'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        return Response(TrainingJobSerializer(job).data)
+
+    @action(detail=False, methods=['get'])
+    def versions(self, request):
+        """列出已保存的模型版本"""
+        serializer = ModelVersionSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        key = model_registry.make_key(data['k_neighbors'], data['min_similarity'], data['algorithm'])
+        current, pinned = model_registry.current_version(key)
+
+        return Response({
+            'current_version': current,
+            'pinned': pinned,
+            'versions': model_registry.list_versions(key)
+        })
+
+    @action(detail=False, methods=['post'])
+    def rollback(self, request):
+        """将服务的模型回滚到指定版本（默认为上一个版本）"""
+        serializer = ModelVersionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        key = model_registry.make_key(data['k_neighbors'], data['min_similarity'], data['algorithm'])
+
+        recommender = model_registry.rollback(key, data.get('version'))
+        if recommender is None:
+            return Response(
+                {'error': '模型版本不存在或加载失败'},
+                status=status.HTTP_404_NOT_FOUND
             )
 
+        return Response({
+            'message': f'已回滚到模型版本{recommender.version}',
+            'version': recommender.version
+        })
+
     @action(detail=False, methods=['get'])
     def neighbors(self, request):
         """获取用户的最近邻"""
@@ -216,11 +362,9 @@ class KNNRecommendationView(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # 创建推荐器
-        recommender = KNNRecommender()
-
-        # 训练模型
-        if not recommender.fit():
+        # 从注册表获取已训练模型
+        recommender = model_registry.get_model()
+        if recommender is None:
             return Response(
                 {'error': '无法训练KNN模型'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -284,11 +428,9 @@ class KNNRecommendationView(viewsets.ViewSet):
                 'is_prediction': False
             })
 
-        # 创建推荐器
-        recommender = KNNRecommender()
-
-        # 训练模型
-        if not recommender.fit():
+        # 从注册表获取已训练模型
+        recommender = model_registry.get_model()
+        if recommender is None:
             return Response(
                 {'error': '无法训练KNN模型'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -304,4 +446,63 @@ class KNNRecommendationView(viewsets.ViewSet):
             },
             'predicted_rating': predicted_rating,
             'is_prediction': True
-        })
\ No newline at end of file
+        })
+
+    @action(detail=False, methods=['get'])
+    def predict_batch(self, request):
+        """批量预测用户对多部电影的评分"""
+        user = request.user
+        movie_ids = request.query_params.get('movie_ids')
+
+        if not movie_ids:
+            return Response(
+                {'error': '需要提供movie_ids参数'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            movie_ids = list(dict.fromkeys(int(movie_id) for movie_id in movie_ids.split(',') if movie_id.strip()))
+        except ValueError:
+            return Response(
+                {'error': 'movie_ids必须是以逗号分隔的整数'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if len(movie_ids) > 100:
+            return Response(
+                {'error': '一次最多预测100部电影'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # 已评分的电影一次查询直接返回实际评分
+        actual_ratings = dict(
+            user.ratings.filter(movie_id__in=movie_ids).values_list('movie_id', 'rating')
+        )
+        unrated_ids = [movie_id for movie_id in movie_ids if movie_id not in actual_ratings]
+
+        predicted_ratings = {}
+        if unrated_ids:
+            # 从注册表获取已训练模型
+            recommender = model_registry.get_model()
+            if recommender is None:
+                return Response(
+                    {'error': '无法训练KNN模型'},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+            predicted_ratings = recommender.predict_ratings(user.id, unrated_ids)
+
+        predictions = {}
+        for movie_id in movie_ids:
+            if movie_id in actual_ratings:
+                predictions[movie_id] = {
+                    'predicted_rating': actual_ratings[movie_id],
+                    'actual_rating': actual_ratings[movie_id],
+                    'is_prediction': False
+                }
+            else:
+                predictions[movie_id] = {
+                    'predicted_rating': predicted_ratings.get(movie_id, 0.0),
+                    'is_prediction': True
+                }
+
+        return Response({'predictions': predictions})
\ No newline at end of file
@@ -212,6 +212,18 @@ export const useMovieStore = defineStore('movie', () => {
     }
   }
   
+  const getTrainingJob = async (jobId) => {
+    try {
+      const response = await axios.get('/api/recommendations/knn/train_status/', {
+        params: { job_id: jobId }
+      })
+      return { success: true, data: response.data }
+    } catch (error) {
+      console.error('获取训练任务状态失败:', error)
+      return { success: false, error }
+    }
+  }
+  
   const getUserNeighbors = async (userId, nNeighbors = 10) => {
     try {
       const response = await axios.get('/api/recommendations/knn/neighbors/', {
@@ -236,6 +248,18 @@ export const useMovieStore = defineStore('movie', () => {
     }
   }
   
+  const predictRatings = async (movieIds) => {
+    try {
+      const response = await axios.get('/api/recommendations/knn/predict_batch/', {
+        params: { movie_ids: movieIds.join(',') }
+      })
+      return { success: true, data: response.data }
+    } catch (error) {
+      console.error('批量预测评分失败:', error)
+      return { success: false, error }
+    }
+  }
+  
   const clearSearchResults = () => {
     searchResults.value = []
   }
@@ -278,6 +302,8 @@ export const useMovieStore = defineStore('movie', () => {
     trainKNNModel,
     getUserNeighbors,
     predictRating,
+    predictRatings,
+    getTrainingJob,
     clearSearchResults,
     clearCurrentMovie
   }